@@ -0,0 +1,62 @@
+"""Сравнение соединения на каждый вызов с постоянным соединением DatabaseManager.
+
+Выполняет много мелких сохранений и чтений последних результатов во
+временной базе и печатает время на операцию для обоих режимов.
+
+Запуск из корня проекта: python -m bench.db_connections [число операций]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from data.database import DatabaseManager
+
+
+class ConnectPerCallManager(DatabaseManager):
+    """Прежнее поведение: новое соединение без настроек на каждый вызов"""
+
+    def _connect(self):
+        return sqlite3.connect(self.db_name)
+
+
+def run(manager_class, operations):
+    # Строки различаются месяцем: одинаковые строки повторно не сохраняются
+    rows = [pd.DataFrame([{
+        'month': i, 'efficiency': 50.0, 'profit': 60.0, 'costs': 40.0, 'investments': 50.0,
+        'market_share': 55.0, 'economic_stability': 60.0, 'tax_rate': 20.0,
+    }]) for i in range(operations)]
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = manager_class(os.path.join(tmp, 'bench.db'))
+        start = time.perf_counter()
+        for row in rows:
+            manager.save_results(row)
+        saves = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(operations):
+            manager.load_recent_results()
+        loads = time.perf_counter() - start
+        manager.close()
+    return saves, loads
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"Операций каждого вида: {operations}")
+    results = {}
+    for name, manager_class in (('соединение на вызов', ConnectPerCallManager),
+                                ('постоянное соединение', DatabaseManager)):
+        saves, loads = run(manager_class, operations)
+        results[name] = saves + loads
+        print(f"  {name:<24} сохранение {saves / operations * 1e6:8.1f} мкс, "
+              f"чтение {loads / operations * 1e6:8.1f} мкс")
+    baseline, pooled = results.values()
+    print(f"Ускорение: {baseline / pooled:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Замер времени запуска приложения.
+
+Каждый модуль импортируется в отдельном процессе (холодный старт), затем
+замеряется создание компонентов. Время до показа окна - импорт
+presentation.gui плюс EfficiencyApp(root) - сравнивается с целевым. Без
+дисплея окно не создать: цель не проверяется, код выхода 2.
+
+Запуск из корня проекта: python -m bench.startup
+"""
+import os
+import subprocess
+import sys
+import time
+
+# Целевое время от запуска до показа окна, секунды
+STARTUP_TARGET = 0.5
+
+MODULES = [
+    'numpy',
+    'pandas',
+    'matplotlib.figure',
+    'matplotlib.backends.backend_tkagg',
+    'skfuzzy.control',
+    'data.database',
+    'logic.fuzzy_logic',
+    'logic.analysis',
+    'presentation.gui',
+]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module):
+    """Время импорта модуля в чистом интерпретаторе"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip())
+
+
+def measure_init():
+    """Время создания компонентов в текущем процессе"""
+    sys.path.insert(0, ROOT)
+    timings = {}
+
+    start = time.perf_counter()
+    from logic.fuzzy_logic import FuzzyEfficiencySystem
+    system = FuzzyEfficiencySystem()
+    timings['FuzzyEfficiencySystem()'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    system.warm_up()
+    timings['FuzzyEfficiencySystem.warm_up()'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from data.database import DatabaseManager
+    DatabaseManager(':memory:')
+    timings['DatabaseManager()'] = time.perf_counter() - start
+    return timings
+
+
+def measure_window():
+    """Время от импорта GUI до созданного окна (None, если нет дисплея)"""
+    code = (
+        "import time; t = time.perf_counter()\n"
+        "import tkinter as tk\n"
+        "from presentation.gui import EfficiencyApp\n"
+        "root = tk.Tk(); EfficiencyApp(root); root.update()\n"
+        "print(time.perf_counter() - t)"
+    )
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    return float(output.stdout.strip()) if output.returncode == 0 else None
+
+
+def main():
+    print("Импорт модулей (холодный старт):")
+    for module in MODULES:
+        print(f"  {module:<40} {measure_import(module):.3f} с")
+
+    print("Инициализация:")
+    for name, seconds in measure_init().items():
+        print(f"  {name:<40} {seconds:.3f} с")
+
+    startup = measure_window()
+    if startup is None:
+        # Импорт GUI загружает только tkinter, он не показывает время до окна
+        print(f"Дисплей недоступен, время импорта GUI: {measure_import('presentation.gui'):.3f} с")
+        print(f"Цель {STARTUP_TARGET:.2f} с: не измерено")
+        return 2
+    print(f"Время до показа окна: {startup:.3f} с")
+
+    status = "OK" if startup <= STARTUP_TARGET else "ПРЕВЫШЕНО"
+    print(f"Цель {STARTUP_TARGET:.2f} с: {status}")
+    return 0 if startup <= STARTUP_TARGET else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,465 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data.database import (
+    DatabaseManager, EXPORT_BATCH_SIZE, INGEST_CHUNK_SIZE, PARQUET_EXTENSIONS, ARROW_EXTENSIONS,
+    ROLLUP_COLUMNS, _ingest_files, _require_pyarrow, _score_chunks,
+)
+
+# Версия формата каталога; хранилища других версий не открываются
+STORE_FORMAT = 2
+
+# Входы ограничены диапазоном 0-100 и хранятся целыми в одном байте
+INPUT_COLUMNS = [column for column in ROLLUP_COLUMNS if column != 'efficiency']
+INPUT_MISSING = 255
+
+# Файлы столбцов и их типы. company - код компании в meta.json (-1 - не указана),
+# month 0 - месяц не указан, timestamp - секунды Unix (UTC), row_key - первые
+# 8 байт хэша содержимого строки для пропуска повторов
+COLUMN_DTYPES = {
+    'timestamp': np.dtype('<i8'),
+    'company': np.dtype('<i4'),
+    'month': np.dtype('<u2'),
+    'efficiency': np.dtype('<f4'),
+    **{column: np.dtype('u1') for column in INPUT_COLUMNS},
+    'row_key': np.dtype('<u8'),
+}
+
+# Индекс ключей строк: отсортированные серии row_key.<start>-<stop>.idx для
+# строк [start, stop), список серий - key_runs в meta.json
+KEY_DTYPE = COLUMN_DTYPES['row_key']
+
+# Отличия типов столбцов в прежних версиях формата (в версии 1 month - один байт)
+LEGACY_DTYPES = {1: {'month': np.dtype('u1')}}
+
+# Число строк, обрабатываемых за раз при агрегатах и экспорте
+READ_CHUNK_SIZE = 1 << 20
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class ColumnarResultsStore:
+    """Хранилище результатов в виде столбцов NumPy, открываемых через memory-map.
+
+    Каталог содержит по файлу на столбец (сырые массивы фиксированного типа,
+    только дозапись) и meta.json - число подтвержденных строк, словарь
+    компаний, признак упорядоченности по времени и список серий индекса ключей
+    строк (см. _index_keys). Строки считаются записанными после атомарной
+    замены meta.json, поэтому хвост файлов после сбоя отбрасывается при
+    следующей записи.
+
+    Входы должны быть целыми (хранятся в uint8), эффективность - во float32.
+    Реализует часть интерфейса DatabaseManager, которую используют окно и
+    отчеты: save_results, ingest_csv, ingest_csv_many, load_recent_results,
+    summary, trend_slopes, company_trend_slopes, companies, export_to_csv,
+    export_columnar и close. Чтение столбцов (column) не копирует данные.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self._meta = json.load(f)
+            if self._meta.get('format') != STORE_FORMAT and self._meta.get('format') not in LEGACY_DTYPES:
+                raise ValueError(f"Неподдерживаемый формат хранилища {path}: {self._meta.get('format')}")
+        else:
+            self._meta = {'format': STORE_FORMAT, 'rows': 0, 'companies': [], 'sorted': True, 'key_runs': []}
+            self._save_meta(self._meta)
+        self._codes = {company: code for code, company in enumerate(self._meta['companies'])}
+        self._dtypes = dict(COLUMN_DTYPES, **LEGACY_DTYPES.get(self._meta['format'], {}))
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.path, 'meta.json')
+
+    def _column_path(self, column):
+        return os.path.join(self.path, column + '.bin')
+
+    def _save_meta(self, meta):
+        tmp_path = self._meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._meta_path)
+
+    def __len__(self):
+        return self._meta['rows']
+
+    def close(self):
+        """Для совместимости с DatabaseManager: открытых соединений нет"""
+
+    def column(self, name, start=0, stop=None):
+        """Столбец в хранимом виде (memory-map только для чтения, без копирования)"""
+        rows = self._meta['rows']
+        stop = rows if stop is None else min(stop, rows)
+        dtype = self._dtypes[name]
+        if stop <= start:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._column_path(name), dtype=dtype, mode='r', offset=start * dtype.itemsize,
+                         shape=(stop - start,))
+
+    def _company_codes(self, data, companies):
+        """Коды компаний строк; новые компании дописываются в companies"""
+        if 'company_id' not in data.columns:
+            return np.full(len(data), -1, dtype=np.int32)
+        known = {company: code for code, company in enumerate(companies)}
+        codes = np.empty(len(data), dtype=np.int32)
+        for i, company in enumerate(data['company_id']):
+            if pd.isna(company):
+                codes[i] = -1
+                continue
+            company = str(company)
+            if company not in known:
+                known[company] = len(companies)
+                companies.append(company)
+            codes[i] = known[company]
+        return codes
+
+    def _encode(self, data, timestamps, companies):
+        """Столбцы для дозаписи из DataFrame (входы вне 0-100 и месяцы вне типа month - ошибка)"""
+        encoded = {'timestamp': timestamps, 'company': self._company_codes(data, companies)}
+        if 'month' in data.columns:
+            month = pd.to_numeric(data['month'], errors='coerce').to_numpy(dtype=np.float64)
+        else:
+            month = np.full(len(data), np.nan)
+        month_max = np.iinfo(self._dtypes['month']).max
+        if np.any((month < 0) | (month > month_max)):
+            raise ValueError(f"Значения month должны быть в диапазоне 0-{month_max}")
+        encoded['month'] = np.nan_to_num(month, nan=0).astype(self._dtypes['month'])
+        if 'efficiency' in data.columns:
+            encoded['efficiency'] = pd.to_numeric(data['efficiency'], errors='coerce').to_numpy(dtype=np.float32)
+        else:
+            encoded['efficiency'] = np.full(len(data), np.nan, dtype=np.float32)
+        for column in INPUT_COLUMNS:
+            if column not in data.columns:
+                encoded[column] = np.full(len(data), INPUT_MISSING, dtype=np.uint8)
+                continue
+            values = pd.to_numeric(data[column], errors='coerce').to_numpy(dtype=np.float64)
+            if np.any((values < 0) | (values > 100)):
+                raise ValueError(f"Значения {column} должны быть в диапазоне 0-100")
+            # Дробные входы не округляются молча: ключ строки и эффективность
+            # считаются по исходным значениям и разошлись бы с хранимыми
+            if np.any(values != np.rint(values)):
+                raise ValueError(f"Значения {column} должны быть целыми")
+            encoded[column] = np.where(np.isnan(values), INPUT_MISSING, values).astype(np.uint8)
+        return encoded
+
+    def _decode(self, encoded, ids, companies=None):
+        """DataFrame в формате DatabaseManager.load_recent_results"""
+        companies = np.array([None] + (self._meta['companies'] if companies is None else companies), dtype=object)
+        frame = pd.DataFrame({
+            'id': ids,
+            'timestamp': pd.to_datetime(encoded['timestamp'], unit='s').strftime(TIMESTAMP_FORMAT),
+            'company_id': companies[encoded['company'] + 1],
+            'month': np.where(encoded['month'] > 0, encoded['month'], np.nan),
+        })
+        frame['efficiency'] = encoded['efficiency'].astype(np.float64)
+        for column in INPUT_COLUMNS:
+            values = encoded[column]
+            frame[column] = np.where(values == INPUT_MISSING, np.nan, values.astype(np.float64))
+        return frame
+
+    def _read(self, indices):
+        """Строки по номерам (копия только выбранных строк)"""
+        encoded = {column: np.asarray(self.column(column)[indices]) for column in self._dtypes}
+        return self._decode(encoded, np.asarray(indices) + 1)
+
+    def _row_keys(self, encoded, companies):
+        hashes = DatabaseManager._row_hashes(self._decode(encoded, np.arange(len(encoded['timestamp'])), companies))
+        return np.array([int(digest[:16], 16) for digest in hashes], dtype=np.uint64)
+
+    def save_results(self, data, timestamps=None):
+        """Дописывает результаты; строки, уже имеющиеся в хранилище, пропускаются.
+
+        timestamps - секунды Unix для каждой строки (по умолчанию текущее время).
+        Возвращает (добавлено, пропущено), как DatabaseManager.save_results.
+        """
+        if timestamps is None:
+            timestamps = np.full(len(data), int(time.time()), dtype=np.int64)
+        with self._lock:
+            rows = self._meta['rows']
+            companies = list(self._meta['companies'])
+            encoded = self._encode(data, np.asarray(timestamps, dtype=np.int64), companies)
+            keys = self._row_keys(encoded, companies)
+
+            # Повторы внутри data и строки, записанные ранее
+            _, first = np.unique(keys, return_index=True)
+            fresh = np.zeros(len(keys), dtype=bool)
+            fresh[first] = True
+            fresh &= ~self._known_keys(keys)
+            encoded = {column: values[fresh] for column, values in encoded.items()}
+            encoded['row_key'] = keys[fresh]
+            inserted = int(fresh.sum())
+            if inserted:
+                self._append(rows, encoded, companies)
+        return inserted, len(data) - inserted
+
+    def _run_path(self, start, stop):
+        return os.path.join(self.path, f'row_key.{start}-{stop}.idx')
+
+    def _run(self, start, stop):
+        return np.memmap(self._run_path(start, stop), dtype=KEY_DTYPE, mode='r', shape=(stop - start,))
+
+    def _known_keys(self, keys):
+        """Какие ключи уже есть в хранилище: двоичный поиск по каждой серии индекса"""
+        runs = self._meta.get('key_runs')
+        if runs is None:
+            # Хранилище без индекса ключей; индекс построится при первой дозаписи
+            return np.isin(keys, self.column('row_key'))
+        known = np.zeros(len(keys), dtype=bool)
+        for start, stop in runs:
+            run = self._run(start, stop)
+            positions = np.minimum(np.searchsorted(run, keys), len(run) - 1)
+            known |= run[positions] == keys
+        return known
+
+    def _write_run(self, start, stop, keys):
+        with open(self._run_path(start, stop), 'wb') as f:
+            f.write(np.sort(keys).astype(KEY_DTYPE).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        return [start, stop]
+
+    def _index_keys(self, rows, keys):
+        """Серии индекса после дозаписи keys и файлы серий, ставшие лишними.
+
+        Новые ключи образуют свою серию; пока предпоследняя серия не больше
+        последней, они сливаются, как разряды двоичного счетчика. Серий
+        остается O(log n), и каждый ключ переписывается O(log n) раз, поэтому
+        дозапись не перечитывает весь столбец row_key.
+        """
+        runs = self._meta.get('key_runs')
+        if runs is None:
+            runs = [self._write_run(0, rows, np.asarray(self.column('row_key')))] if rows else []
+        runs = [list(run) for run in runs]
+        obsolete = []
+        runs.append(self._write_run(rows, rows + len(keys), keys))
+        while len(runs) > 1 and runs[-2][1] - runs[-2][0] <= runs[-1][1] - runs[-1][0]:
+            (first, middle), (_, last) = runs[-2], runs.pop()
+            merged = np.concatenate([self._run(first, middle), self._run(middle, last)])
+            obsolete += [self._run_path(first, middle), self._run_path(middle, last)]
+            runs[-1] = self._write_run(first, last, merged)
+        return runs, obsolete
+
+    def _append(self, rows, encoded, companies):
+        for column, dtype in self._dtypes.items():
+            with open(self._column_path(column), 'ab') as f:
+                # Хвост неподтвержденной записи (сбой до обновления meta.json)
+                f.truncate(rows * dtype.itemsize)
+                f.write(np.ascontiguousarray(encoded[column], dtype=dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        timestamps = encoded['timestamp']
+        ordered = bool(np.all(np.diff(timestamps) >= 0))
+        if rows:
+            ordered = ordered and bool(timestamps[0] >= self.column('timestamp', rows - 1, rows)[0])
+        runs, obsolete = self._index_keys(rows, encoded['row_key'])
+        meta = dict(self._meta, rows=rows + len(timestamps), companies=companies,
+                    sorted=self._meta['sorted'] and ordered, key_runs=runs)
+        self._save_meta(meta)
+        self._meta = meta
+        self._codes = {company: code for code, company in enumerate(companies)}
+        # Слитые серии больше не упоминаются в meta.json
+        for path in obsolete:
+            os.remove(path)
+
+    def ingest_csv(self, filename, fuzzy_system=None, chunksize=INGEST_CHUNK_SIZE, progress=None, company_id=None):
+        """Загружает CSV блоками (см. DatabaseManager.ingest_csv).
+
+        Отдельного учета прогресса нет: повторный вызов после прерывания
+        пропускает уже записанные строки по их хэшам.
+        """
+        return self.ingest_csv_many([filename], fuzzy_system, chunksize, progress, companies={filename: company_id})
+
+    def ingest_csv_many(self, filenames, fuzzy_system=None, chunksize=INGEST_CHUNK_SIZE, progress=None,
+                        companies=None):
+        """Загружает много CSV за один проход (см. DatabaseManager.ingest_csv_many)"""
+        return _ingest_files(filenames, companies, chunksize, self._read_pieces,
+                             lambda pieces: self._write_pieces(pieces, fuzzy_system), progress)
+
+    @staticmethod
+    def _read_pieces(filename, company, chunksize):
+        """Блоки файла в формате DatabaseManager._read_pieces (без учета прогресса)"""
+        rows_done = 0
+        for chunk in pd.read_csv(filename, chunksize=chunksize):
+            if 'company_id' not in chunk.columns and company is not None:
+                chunk['company_id'] = company
+            rows_done += len(chunk)
+            yield filename, None, rows_done, chunk, False
+
+    def _write_pieces(self, pieces, fuzzy_system):
+        """Оценивает блоки без efficiency одним вызовом и записывает все блоки"""
+        frames = _score_chunks([chunk for _, _, _, chunk, _ in pieces], fuzzy_system)
+        return self.save_results(pd.concat(frames, ignore_index=True))[0] if frames else 0
+
+    def load_recent_results(self, limit=12):
+        """Последние результаты (по timestamp, затем id, от новых к старым)"""
+        rows = self._meta['rows']
+        if self._meta['sorted']:
+            # Строки дописывались по времени: последние строки - хвост файлов
+            indices = np.arange(rows - 1, max(rows - limit, 0) - 1, -1)
+        else:
+            timestamps = np.asarray(self.column('timestamp'))
+            order = np.lexsort((np.arange(rows), timestamps))
+            indices = order[::-1][:limit]
+        return self._read(indices)
+
+    def companies(self):
+        """Идентификаторы компаний, у которых есть результаты"""
+        return sorted(self._meta['companies'])
+
+    def _chunks(self, columns, company_id=None):
+        """Порции столбцов по READ_CHUNK_SIZE строк (с фильтром по компании)"""
+        code = None
+        if company_id is not None:
+            code = self._codes.get(str(company_id), -2)
+        rows = self._meta['rows']
+        for start in range(0, rows, READ_CHUNK_SIZE):
+            chunk = {column: self.column(column, start, start + READ_CHUNK_SIZE)
+                     for column in set(columns) | {'company'}}
+            if code is not None:
+                mask = chunk['company'] == code
+                chunk = {column: values[mask] for column, values in chunk.items()}
+            yield chunk
+
+    @staticmethod
+    def _values(chunk, column):
+        values = chunk[column]
+        if column == 'efficiency':
+            return values.astype(np.float64)
+        return np.where(values == INPUT_MISSING, np.nan, values.astype(np.float64))
+
+    def summary(self, company_id=None):
+        """Сводка count, mean, std, min, max по столбцам (см. DatabaseManager.summary)"""
+        stats = {column: np.array([0.0, 0.0, 0.0, np.inf, -np.inf]) for column in ROLLUP_COLUMNS}
+        for chunk in self._chunks(ROLLUP_COLUMNS, company_id):
+            for column in ROLLUP_COLUMNS:
+                values = self._values(chunk, column)
+                values = values[~np.isnan(values)]
+                if len(values):
+                    stats[column] += [len(values), values.sum(), (values * values).sum(), 0, 0]
+                    stats[column][3] = min(stats[column][3], values.min())
+                    stats[column][4] = max(stats[column][4], values.max())
+        columns = [column for column in ROLLUP_COLUMNS if stats[column][0] > 0]
+        n, total, total_sq, low, high = (np.array([stats[column][i] for column in columns]) for i in range(5))
+        mean = total / n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = (total_sq - n * mean ** 2) / (n - 1)
+        return pd.DataFrame(
+            [n, mean, np.sqrt(np.clip(variance, 0, None)), low, high],
+            index=['count', 'mean', 'std', 'min', 'max'], columns=columns,
+        )
+
+    def _slope_sums(self, company_id=None):
+        """Суммы МНК по месяцу для каждой компании.
+
+        Возвращает массив (компании + 1) x столбцы x 6 сумм (n, x, x^2, y, xy,
+        y^2; группа 0 - без компании) и последний месяц каждой группы.
+        """
+        groups = len(self._meta['companies']) + 1
+        sums = np.zeros((groups, len(ROLLUP_COLUMNS), 6))
+        last_x = np.zeros(groups)
+        for chunk in self._chunks(ROLLUP_COLUMNS + ['month'], company_id):
+            x = chunk['month'].astype(np.float64)
+            group = chunk['company'] + 1
+            np.maximum.at(last_x, group, x)
+            for i, column in enumerate(ROLLUP_COLUMNS):
+                y = self._values(chunk, column)
+                valid = (x > 0) & ~np.isnan(y)
+                g, xv, yv = group[valid], x[valid], y[valid]
+                for j, weights in enumerate((None, xv, xv * xv, yv, xv * yv, yv * yv)):
+                    sums[:, i, j] += np.bincount(g, weights, minlength=groups)
+        return sums, last_x
+
+    @staticmethod
+    def _slopes(sums):
+        n, sum_x, sum_xx, sum_y, sum_xy = np.moveaxis(sums[..., :5], -1, 0)
+        denominator = n * sum_xx - sum_x ** 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(denominator != 0, (n * sum_xy - sum_x * sum_y) / denominator, np.nan)
+
+    def trend_slopes(self, company_id=None):
+        """Наклоны трендов по месяцу (см. DatabaseManager.trend_slopes)"""
+        slopes = self._slopes(self._slope_sums(company_id)[0].sum(axis=0))
+        return {column: slope for column, slope in zip(ROLLUP_COLUMNS, slopes) if not np.isnan(slope)}
+
+    def company_trend_slopes(self):
+        """Наклоны трендов всех компаний: DataFrame компании x столбцы ('' - без компании)"""
+        sums = self._slope_sums()[0]
+        present = sums[:, :, 0].sum(axis=1) > 0
+        slopes = pd.DataFrame(self._slopes(sums), index=[''] + self._meta['companies'], columns=ROLLUP_COLUMNS)
+        return slopes[present].sort_index().rename_axis('company_id')
+
+    def trend_sums(self):
+        """Центрированные суммы МНК компаний (см. DatabaseManager.trend_sums)"""
+        sums, last_x = self._slope_sums()
+        n, sum_x, sum_xx, sum_y, sum_xy, sum_yy = np.moveaxis(sums, -1, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_x, mean_y = sum_x / n, sum_y / n
+        index = pd.MultiIndex.from_product([[''] + self._meta['companies'], ROLLUP_COLUMNS],
+                                           names=['company_id', 'column_name'])
+        frame = pd.DataFrame({
+            'n': n.ravel(),
+            'mean_x': mean_x.ravel(),
+            'mean_y': mean_y.ravel(),
+            'sxx': (sum_xx - sum_x * mean_x).ravel(),
+            'sxy': (sum_xy - sum_x * mean_y).ravel(),
+            'syy': (sum_yy - sum_y * mean_y).ravel(),
+            'last_x': np.repeat(last_x, len(ROLLUP_COLUMNS)),
+        }, index=index)
+        return frame[frame['n'] > 0].sort_index()
+
+    def _iter_frames(self, batch_size=EXPORT_BATCH_SIZE):
+        rows = self._meta['rows']
+        for start in range(0, rows, batch_size):
+            yield self._read(np.arange(start, min(start + batch_size, rows)))
+
+    def export_to_csv(self, filename, progress=None):
+        """Экспортирует все строки в CSV в порядке записи"""
+        total = 0
+        with open(filename, 'w', newline='') as f:
+            header = True
+            for frame in self._iter_frames():
+                frame.to_csv(f, header=header, index=False)
+                header = False
+                total += len(frame)
+                if progress is not None:
+                    progress(total)
+        return total
+
+    def export_columnar(self, filename, batch_size=EXPORT_BATCH_SIZE, compression='zstd', progress=None):
+        """Экспортирует все строки в Parquet или Arrow IPC (см. DatabaseManager.export_columnar)"""
+        pa = _require_pyarrow()
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in PARQUET_EXTENSIONS + ARROW_EXTENSIONS:
+            raise ValueError(f"Неизвестный формат файла: {extension}")
+
+        writer = None
+        total = 0
+        try:
+            for frame in self._iter_frames(batch_size):
+                frame['timestamp'] = pd.to_datetime(frame['timestamp']).astype('datetime64[s]')
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    if extension in PARQUET_EXTENSIONS:
+                        writer = pa.parquet.ParquetWriter(filename, table.schema, compression=compression)
+                    else:
+                        options = pa.ipc.IpcWriteOptions(compression=compression)
+                        writer = pa.ipc.new_file(filename, table.schema, options=options)
+                writer.write_table(table)
+                total += len(frame)
+                if progress is not None:
+                    progress(total)
+        finally:
+            if writer is not None:
+                writer.close()
+        return total
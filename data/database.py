@@ -1,15 +1,202 @@
+import csv
+import hashlib
+import os
 import sqlite3
+import threading
+from collections import deque
+from itertools import islice
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
+# Столбцы данных таблицы results (кроме id и timestamp) и их типы
+RESULT_COLUMNS = {
+    'company_id': 'TEXT',
+    'month': 'INTEGER',
+    'efficiency': 'REAL',
+    'profit': 'REAL',
+    'costs': 'REAL',
+    'investments': 'REAL',
+    'market_share': 'REAL',
+    'economic_stability': 'REAL',
+    'tax_rate': 'REAL',
+    'flags': 'INTEGER',
+}
+
+# Производные столбцы: вычисляются по остальным (маска сработавших правил
+# рекомендаций, см. compute_flags) и не входят в хэш строки и сводные таблицы
+DERIVED_COLUMNS = ('flags',)
+
+# Сколько хэшей проверять одним запросом (ограничение числа параметров SQLite)
+HASH_LOOKUP_BATCH = 500
+
+# Точность, с которой значения сравниваются при поиске повторов
+HASH_DECIMALS = 9
+
+# Числовые столбцы results (входят в хэш содержимого строки)
+NUMERIC_COLUMNS = [column for column, column_type in RESULT_COLUMNS.items()
+                   if column_type != 'TEXT' and column not in DERIVED_COLUMNS]
+
+# Столбцы, по которым ведутся сводные таблицы (агрегаты по компаниям и периодам)
+ROLLUP_COLUMNS = [column for column in NUMERIC_COLUMNS if column != 'month']
+
+# Число строк CSV, читаемых и записываемых за одну транзакцию
+INGEST_CHUNK_SIZE = 50000
+
+# Настройки соединения: WAL позволяет читать во время записи, synchronous=NORMAL
+# безопасен в режиме WAL, кэш страниц 64 МБ, отображение файла в память до 256 МБ
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Размер кэша подготовленных выражений sqlite3 на соединение
+STATEMENT_CACHE_SIZE = 256
+
+# Число строк в одной группе строк Parquet / пакете Arrow при экспорте и импорте
+EXPORT_BATCH_SIZE = 100000
+
+# Расширения файлов колоночного экспорта
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+# Расширения файлов базы SQLite (остальные пути - столбцовое хранилище)
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+
+def _require_pyarrow():
+    """Импортирует pyarrow (необязательная зависимость колоночного экспорта)"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError("Для экспорта в Parquet/Arrow установите пакет pyarrow") from error
+    return pyarrow
+
+
+def _ingest_files(filenames, companies, chunksize, read_pieces, write_pieces, progress=None):
+    """Общий цикл ingest_csv_many хранилищ результатов.
+
+    read_pieces(filename, company, chunksize) выдает блоки файла кортежами
+    (source, stat, rows_done, chunk, finished); блоки всех файлов копятся до
+    chunksize строк и передаются write_pieces(pieces), который возвращает
+    число добавленных строк. Компания файла - companies[filename] (None - без
+    компании), иначе имя файла без расширения. progress(rows_done)
+    вызывается после каждой записи. Возвращает число добавленных строк.
+    """
+    pending, pending_rows = [], 0
+    written = rows_total = 0
+    for filename in filenames:
+        if companies is not None and filename in companies:
+            company = companies[filename]
+        else:
+            company = os.path.splitext(os.path.basename(filename))[0]
+        for piece in read_pieces(filename, company, chunksize):
+            pending.append(piece)
+            pending_rows += len(piece[3])
+            if pending_rows >= chunksize:
+                written += write_pieces(pending)
+                rows_total += pending_rows
+                pending, pending_rows = [], 0
+                if progress is not None:
+                    progress(rows_total)
+    if pending:
+        written += write_pieces(pending)
+        rows_total += pending_rows
+        if progress is not None:
+            progress(rows_total)
+    return written
+
+
+def _score_chunks(chunks, fuzzy_system):
+    """Непустые блоки; блоки без efficiency оцениваются одним вызовом evaluate_batch"""
+    chunks = [chunk for chunk in chunks if len(chunk)]
+    unscored = [chunk for chunk in chunks if 'efficiency' not in chunk.columns]
+    if unscored:
+        if fuzzy_system is None:
+            raise ValueError("В файле нет столбца efficiency, нужна система оценки")
+        scores = np.asarray(fuzzy_system.evaluate_batch(pd.concat(unscored)))
+        offsets = np.cumsum([0] + [len(chunk) for chunk in unscored])
+        for chunk, start, stop in zip(unscored, offsets[:-1], offsets[1:]):
+            chunk['efficiency'] = scores[start:stop]
+    return chunks
+
+
+def open_results_store(path='efficiency.db'):
+    """Открывает хранилище результатов по пути.
+
+    Файл SQLite (.db, .sqlite, :memory:) - DatabaseManager, любой другой путь -
+    каталог столбцового хранилища ColumnarResultsStore с тем же интерфейсом
+    для сохранения, импорта, отчетов и экспорта.
+    """
+    if path == ':memory:' or os.path.splitext(path)[1].lower() in SQLITE_EXTENSIONS:
+        return DatabaseManager(path)
+    from data.columnar import ColumnarResultsStore
+    return ColumnarResultsStore(path)
+
 
 class DatabaseManager:
+    """Доступ к базе результатов.
+
+    У каждого потока одно долгоживущее соединение с настроенными PRAGMA;
+    подготовленные выражения переиспользуются через кэш sqlite3, поэтому SQL
+    запросов строится одинаково от вызова к вызову. Схема создается один раз
+    на файл базы в пределах процесса.
+    """
+
+    _initialized = set()
+    _initialized_lock = threading.Lock()
+
     def __init__(self, db_name='efficiency.db'):
         self.db_name = db_name
-        self._init_db()
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._shared = None
+        key = None if db_name == ':memory:' else os.path.abspath(db_name)
+        with self._initialized_lock:
+            if key is None or key not in self._initialized:
+                self._init_db()
+                if key is not None:
+                    self._initialized.add(key)
+
+    def _connect(self):
+        """Соединение текущего потока (создается при первом обращении)"""
+        if self.db_name == ':memory:':
+            # База в памяти существует только внутри одного соединения
+            if self._shared is None:
+                self._shared = self._open()
+            return self._shared
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
+
+    def _open(self):
+        # Соединение используется только своим потоком, но close() может прийти из любого
+        conn = sqlite3.connect(self.db_name, cached_statements=STATEMENT_CACHE_SIZE,
+                               check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Закрывает соединения всех потоков"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+        self._shared = None
 
     def _init_db(self):
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             conn.execute('''CREATE TABLE IF NOT EXISTS results
                          (id INTEGER PRIMARY KEY AUTOINCREMENT,
                           timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -20,22 +207,572 @@ class DatabaseManager:
                           market_share REAL,
                           economic_stability REAL,
                           tax_rate REAL)''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS ingest_progress
+                         (source TEXT PRIMARY KEY,
+                          size INTEGER,
+                          mtime REAL,
+                          rows_done INTEGER,
+                          finished INTEGER DEFAULT 0,
+                          updated DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+
+            # Столбцы, добавленные после создания таблицы в старых базах
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+            for column, column_type in RESULT_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE results ADD COLUMN {column} {column_type}")
+
+            # Хэш содержимого строки: повторное сохранение тех же данных пропускается
+            if 'row_hash' not in existing:
+                conn.execute("ALTER TABLE results ADD COLUMN row_hash TEXT")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_results_row_hash ON results (row_hash)")
+            if 'row_hash' not in existing:
+                self._backfill_hashes(conn)
+
+            # Сводная таблица: агрегаты по компании и месяцу (company_id '' -
+            # компания не указана, period 0 - месяц не указан). Для тренда по
+            # месяцу x постоянен внутри периода, поэтому суммы n, sum_x, sum_xx,
+            # sum_xy получаются из n и sum без отдельных столбцов.
+            rollup_columns = {row[1] for row in conn.execute("PRAGMA table_info(results_rollup)")}
+            if rollup_columns and 'company_id' not in rollup_columns:
+                # Сводная таблица без разбивки по компаниям пересоздается
+                conn.execute("DROP TABLE results_rollup")
+            conn.execute('''CREATE TABLE IF NOT EXISTS results_rollup
+                         (company_id TEXT NOT NULL DEFAULT '',
+                          period INTEGER NOT NULL,
+                          column_name TEXT NOT NULL,
+                          n INTEGER NOT NULL,
+                          sum REAL NOT NULL,
+                          sum_sq REAL NOT NULL,
+                          min REAL,
+                          max REAL,
+                          PRIMARY KEY (company_id, period, column_name))''')
+            if 'company_id' not in rollup_columns:
+                self._rebuild_rollups(conn)
+
+            # Индексы под сортировку по времени, постраничную выборку и фильтры
+            # по месяцу и компании
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_timestamp ON results (timestamp, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_month ON results (month, timestamp, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_company ON results (company_id, timestamp, id)")
+            # Частичный индекс только по строкам со сработавшими рекомендациями
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_flagged ON results (timestamp, id) WHERE flags > 0")
+
+    @staticmethod
+    def _row_hashes(data):
+        """Хэши содержимого строк по числовым столбцам и компании.
+
+        Значения приводятся к float64 и округляются до HASH_DECIMALS знаков
+        (50 и 50.0 совпадают, как и числа, прошедшие через CSV с потерей
+        последнего бита); отсутствующие столбцы и пропуски дают один и тот же
+        NaN. Строки без компании хэшируются так же, как до появления
+        company_id. id и timestamp в хэш не входят.
+        """
+        values = np.full((len(data), len(NUMERIC_COLUMNS)), np.nan)
+        for i, column in enumerate(NUMERIC_COLUMNS):
+            if column in data.columns:
+                values[:, i] = pd.to_numeric(data[column], errors='coerce').to_numpy(dtype=np.float64)
+        values = np.round(values, HASH_DECIMALS) + 0.0  # -0.0 -> 0.0
+        values[np.isnan(values)] = np.nan  # единое представление NaN
+        if 'company_id' in data.columns:
+            companies = [None if pd.isna(company) else str(company).encode() for company in data['company_id']]
+        else:
+            companies = [None] * len(data)
+        hashes = []
+        for row, company in zip(values, companies):
+            digest = hashlib.blake2b(row.tobytes(), digest_size=16)
+            if company is not None:
+                digest.update(b'\0' + company)
+            hashes.append(digest.hexdigest())
+        return hashes
+
+    @classmethod
+    def _backfill_hashes(cls, conn):
+        """Заполняет row_hash у строк, записанных до появления столбца.
+
+        Повторы среди старых строк получают NULL (UPDATE OR IGNORE), сами строки
+        не удаляются.
+        """
+        columns = ['id'] + list(RESULT_COLUMNS)
+        rows = conn.execute(f"SELECT {', '.join(columns)} FROM results ORDER BY id")
+        while True:
+            batch = rows.fetchmany(EXPORT_BATCH_SIZE)
+            if not batch:
+                break
+            frame = pd.DataFrame.from_records(batch, columns=columns)
+            conn.executemany(
+                "UPDATE OR IGNORE results SET row_hash = ? WHERE id = ?",
+                zip(cls._row_hashes(frame), frame['id'].tolist())
+            )
+
+    def _existing_hashes(self, conn, hashes):
+        existing = set()
+        for start in range(0, len(hashes), HASH_LOOKUP_BATCH):
+            batch = hashes[start:start + HASH_LOOKUP_BATCH]
+            existing.update(row[0] for row in conn.execute(
+                f"SELECT row_hash FROM results WHERE row_hash IN ({', '.join('?' * len(batch))})", batch
+            ))
+        return existing
+
+    def _insert_frame(self, conn, data, keep_timestamp=False):
+        """Добавляет в results строки, которых там еще нет (лишние столбцы отбрасываются).
+
+        Строки сравниваются по хэшу содержимого: повторы внутри data и строки,
+        уже сохраненные ранее, пропускаются. Возвращает число добавленных строк.
+        Блокировка записи берется до поиска повторов, поэтому строки, добавленные
+        другим соединением, не попадут в агрегаты и счетчик второй раз.
+        """
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        hashes = pd.Series(self._row_hashes(data), index=data.index)
+        fresh = ~hashes.duplicated()
+        existing = self._existing_hashes(conn, hashes[fresh].tolist())
+        fresh &= ~hashes.isin(existing)
+        data = data[fresh.to_numpy()].assign(row_hash=hashes[fresh].to_numpy())
+
+        columns = [column for column in RESULT_COLUMNS if column in data.columns] + ['row_hash']
+        if keep_timestamp and 'timestamp' in data.columns:
+            columns.append('timestamp')
+        conn.executemany(
+            f"INSERT INTO results ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            "ON CONFLICT (row_hash) DO NOTHING",
+            data[columns].itertuples(index=False, name=None)
+        )
+        self._update_rollups(conn, data)
+        return len(data)
+
+    @staticmethod
+    def _update_rollups(conn, data):
+        """Добавляет агрегаты новых строк в results_rollup (в той же транзакции)"""
+        columns = [column for column in ROLLUP_COLUMNS if column in data.columns]
+        if not columns or data.empty:
+            return
+        period = data['month'].fillna(0).astype(int) if 'month' in data.columns else pd.Series(0, index=data.index)
+        if 'company_id' in data.columns:
+            company = data['company_id'].astype(object).where(data['company_id'].notna(), '').astype(str)
+        else:
+            company = pd.Series('', index=data.index)
+        keys = [company.to_numpy(), period.to_numpy()]
+        values = data[columns].apply(pd.to_numeric, errors='coerce')
+        grouped = values.groupby(keys)
+        stats = pd.concat({
+            'n': grouped.count(),
+            'sum': grouped.sum(),
+            'sum_sq': (values ** 2).groupby(keys).sum(),
+            'min': grouped.min(),
+            'max': grouped.max(),
+        }, axis=1).stack(level=1, future_stack=True)
+        stats = stats[stats['n'] > 0].rename_axis(['company_id', 'period', 'column_name']).reset_index()
+        stats['n'] = stats['n'].astype(int)
+        conn.executemany(
+            '''INSERT INTO results_rollup (company_id, period, column_name, n, sum, sum_sq, min, max)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(company_id, period, column_name) DO UPDATE SET
+                   n = n + excluded.n,
+                   sum = sum + excluded.sum,
+                   sum_sq = sum_sq + excluded.sum_sq,
+                   min = MIN(COALESCE(min, excluded.min), excluded.min),
+                   max = MAX(COALESCE(max, excluded.max), excluded.max)''',
+            stats[['company_id', 'period', 'column_name', 'n', 'sum', 'sum_sq', 'min', 'max']].itertuples(
+                index=False, name=None
+            )
+        )
+
+    @staticmethod
+    def _rebuild_rollups(conn):
+        """Пересчитывает results_rollup по всей таблице results"""
+        conn.execute("DELETE FROM results_rollup")
+        for column in ROLLUP_COLUMNS:
+            conn.execute(
+                f'''INSERT INTO results_rollup (company_id, period, column_name, n, sum, sum_sq, min, max)
+                    SELECT COALESCE(company_id, ''), COALESCE(month, 0), ?, COUNT({column}), TOTAL({column}),
+                           TOTAL({column} * {column}), MIN({column}), MAX({column})
+                    FROM results WHERE {column} IS NOT NULL
+                    GROUP BY COALESCE(company_id, ''), COALESCE(month, 0)''',
+                (column,)
+            )
+
+    def rebuild_rollups(self):
+        """Пересчитывает сводные таблицы (например, после ручной правки results)"""
+        with self._connect() as conn:
+            self._rebuild_rollups(conn)
+
+    def _load_rollups(self, company_id=None):
+        with self._connect() as conn:
+            if company_id is None:
+                return pd.read_sql("SELECT * FROM results_rollup", conn)
+            return pd.read_sql("SELECT * FROM results_rollup WHERE company_id = ?", conn, params=(str(company_id),))
+
+    def summary(self, company_id=None):
+        """Сводка по таблице results из агрегатов: count, mean, std, min, max.
+
+        Время не зависит от числа строк в results (читается сводная таблица:
+        не больше 12 x 7 строк на компанию). company_id ограничивает сводку
+        одной компанией. Квартилей, как в describe(), здесь нет.
+        """
+        rollups = self._load_rollups(company_id)
+        grouped = rollups.groupby('column_name')
+        n = grouped['n'].sum()
+        total = grouped['sum'].sum()
+        total_sq = grouped['sum_sq'].sum()
+        mean = total / n
+        variance = (total_sq - n * mean ** 2) / (n - 1)
+        summary = pd.DataFrame({
+            'count': n,
+            'mean': mean,
+            'std': variance.clip(lower=0) ** 0.5,
+            'min': grouped['min'].min(),
+            'max': grouped['max'].max(),
+        }).T
+        return summary[[column for column in ROLLUP_COLUMNS if column in summary.columns]]
+
+    @staticmethod
+    def _rollup_slopes(rollups, keys):
+        """МНК-наклоны по месяцу для групп сводной таблицы (Series с индексом keys)"""
+        rollups = rollups[rollups['period'] > 0]
+        x = rollups['period'].astype(float)
+        rollups = rollups.assign(sum_x=x * rollups['n'], sum_xx=x * x * rollups['n'], sum_xy=x * rollups['sum'])
+        sums = rollups.groupby(keys)[['n', 'sum', 'sum_x', 'sum_xx', 'sum_xy']].sum()
+        denominator = sums['n'] * sums['sum_xx'] - sums['sum_x'] ** 2
+        return (sums['n'] * sums['sum_xy'] - sums['sum_x'] * sums['sum']) / denominator.where(denominator != 0)
+
+    def trend_slopes(self, company_id=None):
+        """Наклоны линейного тренда столбцов по месяцу из агрегатов.
+
+        Совпадают с МНК по всем строкам с указанным месяцем (как
+        TrendAnalyzer.analyze_trends), но считаются по сводной таблице.
+        company_id ограничивает расчет одной компанией.
+        """
+        slopes = self._rollup_slopes(self._load_rollups(company_id), 'column_name')
+        return {column: slopes[column] for column in ROLLUP_COLUMNS if column in slopes.index}
+
+    def company_trend_slopes(self):
+        """Наклоны трендов всех компаний сразу: DataFrame компании x столбцы.
+
+        Один групповой расчет по сводной таблице, без запроса на компанию.
+        Строки без компании попадают в группу ''.
+        """
+        slopes = self._rollup_slopes(self._load_rollups(), ['company_id', 'column_name']).unstack('column_name')
+        return slopes.reindex(columns=[column for column in ROLLUP_COLUMNS if column in slopes.columns])
+
+    def trend_sums(self):
+        """Центрированные суммы МНК по месяцу для каждой компании и столбца из агрегатов.
+
+        Возвращает DataFrame с индексом (company_id, column_name) и столбцами
+        n, mean_x, mean_y, sxx, sxy, syy (суммы отклонений от средних) и
+        last_x - последний месяц с данными. Месяц внутри периода постоянен,
+        поэтому суммы точны и получаются без чтения results; тренды по ним
+        дает TrendAnalyzer.fit_from_sums.
+        """
+        rollups = self._load_rollups()
+        rollups = rollups[rollups['period'] > 0]
+        x = rollups['period'].astype(float)
+        rollups = rollups.assign(sum_x=x * rollups['n'], sum_xx=x * x * rollups['n'], sum_xy=x * rollups['sum'])
+        grouped = rollups.groupby(['company_id', 'column_name'])
+        sums = grouped[['n', 'sum', 'sum_sq', 'sum_x', 'sum_xx', 'sum_xy']].sum()
+        n = sums['n']
+        mean_x, mean_y = sums['sum_x'] / n, sums['sum'] / n
+        return pd.DataFrame({
+            'n': n,
+            'mean_x': mean_x,
+            'mean_y': mean_y,
+            'sxx': sums['sum_xx'] - sums['sum_x'] * mean_x,
+            'sxy': sums['sum_xy'] - sums['sum_x'] * mean_y,
+            'syy': sums['sum_sq'] - sums['sum'] * mean_y,
+            'last_x': grouped['period'].max(),
+        })
+
+    def companies(self):
+        """Идентификаторы компаний, у которых есть результаты в базе"""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT DISTINCT company_id FROM results_rollup WHERE company_id != '' ORDER BY company_id"
+            )]
 
     def save_results(self, data):
-        """Сохраняет результаты расчета в базу данных"""
-        with sqlite3.connect(self.db_name) as conn:
-            data.to_sql('results', conn, if_exists='append', index=False)
+        """Сохраняет результаты расчета в базу данных.
+
+        Повторное сохранение тех же строк ничего не добавляет. Возвращает
+        (добавлено, пропущено).
+        """
+        with self._connect() as conn:
+            inserted = self._insert_frame(conn, data)
+        return inserted, len(data) - inserted
+
+    def ingest_csv(self, filename, fuzzy_system=None, chunksize=INGEST_CHUNK_SIZE, progress=None, company_id=None):
+        """Потоково загружает CSV в таблицу results.
+
+        Файл читается блоками по chunksize строк; если в нем нет столбца
+        efficiency, блок оценивается fuzzy_system.evaluate_batch. Каждый блок
+        записывается в отдельной транзакции вместе с отметкой о прогрессе в
+        ingest_progress, поэтому после прерывания повторный вызов продолжает
+        с первой незаписанной строки. Если файл изменился (размер или время
+        модификации), загрузка начинается заново. Если в файле нет столбца
+        company_id, строкам присваивается company_id (по умолчанию - без
+        компании). progress(rows_done) вызывается после каждого блока.
+        Возвращает число строк, добавленных этим вызовом (уже сохраненные
+        ранее строки пропускаются).
+        """
+        return self.ingest_csv_many([filename], fuzzy_system, chunksize, progress, companies={filename: company_id})
+
+    def ingest_csv_many(self, filenames, fuzzy_system=None, chunksize=INGEST_CHUNK_SIZE, progress=None,
+                        companies=None):
+        """Загружает за один проход много CSV-файлов (например, по файлу на компанию).
+
+        Строки файлов копятся в общий блок до chunksize строк: блок оценивается
+        одним вызовом fuzzy_system.evaluate_batch и записывается одной
+        транзакцией вместе с прогрессом каждого файла, поэтому тысячи мелких
+        файлов не превращаются в тысячи транзакций, а прерванная загрузка
+        продолжается как в ingest_csv. Компания строк берется из столбца
+        company_id файла, иначе из словаря companies (имя файла -> компания,
+        None - без компании), иначе из имени файла без расширения. progress(rows_done) вызывается после каждого блока.
+        Возвращает число добавленных строк.
+        """
+        return _ingest_files(filenames, companies, chunksize, self._read_pieces,
+                             lambda pieces: self._write_pieces(pieces, fuzzy_system), progress)
+
+    def _read_pieces(self, filename, company, chunksize):
+        """Блоки файла (source, stat, rows_done, chunk, finished) с учетом прогресса.
+
+        Последний элемент - пустой блок с finished=True; полностью загруженный и
+        не изменившийся файл не дает ни одного блока.
+        """
+        source = os.path.abspath(filename)
+        stat = os.stat(source)
+        with self._connect() as conn:
+            state = conn.execute(
+                "SELECT size, mtime, rows_done, finished FROM ingest_progress WHERE source = ?",
+                (source,)
+            ).fetchone()
+        rows_done = 0
+        if state is not None and state[0] == stat.st_size and state[1] == stat.st_mtime:
+            if state[3]:
+                return
+            rows_done = state[2]
+
+        with open(source, newline='') as f:
+            columns = next(csv.reader([f.readline()]))
+            # Уже записанные строки пропускаются построчно, без загрузки в память
+            deque(islice(f, rows_done), maxlen=0)
+            for chunk in pd.read_csv(f, names=columns, header=None, chunksize=chunksize):
+                if 'company_id' not in chunk.columns and company is not None:
+                    chunk['company_id'] = company
+                rows_done += len(chunk)
+                yield source, stat, rows_done, chunk, False
+        yield source, stat, rows_done, pd.DataFrame(columns=columns), True
+
+    def _write_pieces(self, pieces, fuzzy_system):
+        """Оценивает и записывает блоки нескольких файлов одной транзакцией"""
+        frames = _score_chunks([chunk for _, _, _, chunk, _ in pieces], fuzzy_system)
+        with self._connect() as conn:
+            written = self._insert_frame(conn, pd.concat(frames, ignore_index=True)) if frames else 0
+            for source, stat, rows_done, _, finished in pieces:
+                self._save_progress(conn, source, stat, rows_done, finished)
+        return written
+
+    @staticmethod
+    def _save_progress(conn, source, stat, rows_done, finished):
+        conn.execute(
+            '''INSERT INTO ingest_progress (source, size, mtime, rows_done, finished, updated)
+               VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+               ON CONFLICT(source) DO UPDATE SET
+                   size = excluded.size, mtime = excluded.mtime, rows_done = excluded.rows_done,
+                   finished = excluded.finished, updated = excluded.updated''',
+            (source, stat.st_size, stat.st_mtime, rows_done, int(finished))
+        )
+
+    def compute_flags(self, rules, recompute=False):
+        """Заполняет столбец flags по таблице правил одним UPDATE.
+
+        rules - список (столбец, сравнение, порог, ...), как
+        RECOMMENDATION_RULES в logic.analysis: бит i маски установлен, если
+        выполнено правило rules[i] (NULL в столбце правило не включает).
+        По умолчанию считаются только строки без флагов (новые или
+        загруженные импортом); recompute=True пересчитывает все, например после
+        изменения порогов. Возвращает число обновленных строк.
+        """
+        # Те же сравнения, что и у RecommendationEngine.evaluate_flags
+        from logic.analysis import RULE_OPERATORS
+
+        terms, params = [], []
+        for bit, (column, operator, threshold, *_) in enumerate(rules):
+            if column not in NUMERIC_COLUMNS or operator not in RULE_OPERATORS:
+                raise ValueError(f"Недопустимое правило: {column} {operator} {threshold}")
+            terms.append(f"(CASE WHEN {column} {operator} ? THEN {1 << bit} ELSE 0 END)")
+            params.append(float(threshold))
+        expression = ' | '.join(terms) if terms else '0'
+        where = "" if recompute else "WHERE flags IS NULL"
+        with self._connect() as conn:
+            return conn.execute(f"UPDATE results SET flags = {expression} {where}", params).rowcount
+
+    def flagged_months(self, flags, company_id=None):
+        """Число строк со сработавшими правилами маски flags по компаниям и месяцам"""
+        conditions, params = self._filters(company_id=company_id, flags=flags)
+        with self._connect() as conn:
+            return pd.read_sql(
+                f"SELECT company_id, month, COUNT(*) AS rows FROM results WHERE {' AND '.join(conditions)} "
+                "GROUP BY company_id, month ORDER BY company_id, month",
+                conn, params=params
+            )
 
     def load_recent_results(self, limit=12):
         """Загружает последние результаты из базы данных"""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             return pd.read_sql(
-                f"SELECT * FROM results ORDER BY timestamp DESC LIMIT {limit}",
-                conn
+                "SELECT * FROM results ORDER BY timestamp DESC, id DESC LIMIT ?",
+                conn, params=(limit,)
+            )
+
+    def load_page(self, after=None, limit=100, columns=None, since=None, until=None, month=None, company_id=None,
+                  flags=None):
+        """Постраничная выборка результатов от новых к старым.
+
+        after - курсор (timestamp, id) последней строки предыдущей страницы,
+        columns - список нужных столбцов (id и timestamp добавляются всегда),
+        since/until - границы timestamp (включительно), month и company_id -
+        фильтры по месяцу и компании, flags - маска правил рекомендаций (строки,
+        где сработало хотя бы одно из них).
+        Страница выбирается по индексу без OFFSET, поэтому время не зависит от
+        ее номера. Возвращает (DataFrame, курсор следующей страницы или None).
+        """
+        columns = self._projection(columns)
+        conditions, params = self._filters(since, until, month, company_id, flags)
+        if after is not None:
+            conditions.append("(timestamp, id) < (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._connect() as conn:
+            page = pd.read_sql(
+                f"SELECT {', '.join(columns)} FROM results {where} "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                conn, params=params + [limit]
             )
+        cursor = None
+        if len(page) == limit:
+            cursor = (page['timestamp'].iloc[-1], int(page['id'].iloc[-1]))
+        return page, cursor
 
-    def export_to_csv(self, filename):
+    @staticmethod
+    def _projection(columns):
+        """Проверенный список столбцов для SELECT"""
+        if columns is None:
+            return ['id', 'timestamp'] + list(RESULT_COLUMNS)
+        unknown = set(columns) - set(RESULT_COLUMNS) - {'id', 'timestamp'}
+        if unknown:
+            raise ValueError(f"Неизвестные столбцы: {', '.join(sorted(unknown))}")
+        return ['id', 'timestamp'] + [column for column in columns if column not in ('id', 'timestamp')]
+
+    @staticmethod
+    def _filters(since=None, until=None, month=None, company_id=None, flags=None):
+        """Условия WHERE и параметры для фильтров по времени, месяцу, компании и флагам"""
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(str(since))
+        if until is not None:
+            conditions.append("timestamp <= ?")
+            params.append(str(until))
+        if month is not None:
+            conditions.append("month = ?")
+            params.append(int(month))
+        if company_id is not None:
+            conditions.append("company_id = ?")
+            params.append(str(company_id))
+        if flags is not None:
+            # flags > 0 позволяет использовать частичный индекс idx_results_flagged
+            conditions.append("flags > 0 AND (flags & ?) != 0")
+            params.append(int(flags))
+        return conditions, params
+
+    def _iter_batches(self, columns, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+        """Читает results курсором порциями по batch_size строк (списки кортежей)"""
+        conditions, params = self._filters(since, until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self._connect().execute(
+            f"SELECT {', '.join(columns)} FROM results {where} ORDER BY id", params
+        )
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def export_to_csv(self, filename, since=None, until=None, progress=None):
         """Экспортирует данные в CSV файл"""
-        with sqlite3.connect(self.db_name) as conn:
-            df = pd.read_sql("SELECT * FROM results", conn)
-            df.to_csv(filename, index=False)
\ No newline at end of file
+        columns = self._projection(None)
+        total = 0
+        with open(filename, 'w', newline='') as f:
+            f.write(','.join(columns) + '\n')
+            for rows in self._iter_batches(columns, since, until):
+                pd.DataFrame.from_records(rows, columns=columns).to_csv(f, header=False, index=False)
+                total += len(rows)
+                if progress is not None:
+                    progress(total)
+        return total
+
+    def export_columnar(self, filename, since=None, until=None, batch_size=EXPORT_BATCH_SIZE, compression='zstd',
+                        progress=None):
+        """Потоково экспортирует results в Parquet или Arrow IPC.
+
+        Формат выбирается по расширению (.parquet/.pq или .arrow/.feather/.ipc).
+        Строки читаются курсором порциями по batch_size и записываются отдельными
+        группами строк, поэтому память не зависит от размера таблицы.
+        since/until ограничивают timestamp, progress(rows_done) вызывается после
+        каждой группы. Возвращает число строк.
+        """
+        pa = _require_pyarrow()
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in PARQUET_EXTENSIONS + ARROW_EXTENSIONS:
+            raise ValueError(f"Неизвестный формат файла: {extension}")
+
+        columns = self._projection(None)
+        types = {'id': pa.int64(), 'timestamp': pa.timestamp('s')}
+        column_types = {'INTEGER': pa.int64(), 'REAL': pa.float64(), 'TEXT': pa.string()}
+        types.update({column: column_types[column_type] for column, column_type in RESULT_COLUMNS.items()})
+        schema = pa.schema([(column, types[column]) for column in columns])
+
+        if extension in PARQUET_EXTENSIONS:
+            writer = pa.parquet.ParquetWriter(filename, schema, compression=compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=compression)
+            writer = pa.ipc.new_file(filename, schema, options=options)
+
+        total = 0
+        with writer:
+            for rows in self._iter_batches(columns, since, until, batch_size):
+                arrays = [pa.array(values).cast(types[column])
+                          for column, values in zip(columns, zip(*rows))]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                total += len(rows)
+                if progress is not None:
+                    progress(total)
+        return total
+
+    def import_columnar(self, filename, batch_size=EXPORT_BATCH_SIZE):
+        """Загружает файл Parquet/Arrow IPC, созданный export_columnar.
+
+        Файл читается пакетами, каждый пакет записывается в отдельной
+        транзакции; id назначаются заново, timestamp сохраняется, строки,
+        уже имеющиеся в базе, пропускаются. Возвращает число добавленных строк.
+        """
+        pa = _require_pyarrow()
+        extension = os.path.splitext(filename)[1].lower()
+        if extension in PARQUET_EXTENSIONS:
+            batches = pa.parquet.ParquetFile(filename).iter_batches(batch_size=batch_size)
+        elif extension in ARROW_EXTENSIONS:
+            reader = pa.ipc.open_file(filename)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        else:
+            raise ValueError(f"Неизвестный формат файла: {extension}")
+
+        total = 0
+        for batch in batches:
+            data = batch.to_pandas()
+            if 'timestamp' in data.columns:
+                data['timestamp'] = data['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+            with self._connect() as conn:
+                total += self._insert_frame(conn, data, keep_timestamp=True)
+        return total
@@ -1,33 +1,41 @@
-import numpy as np
-import pandas as pd
+import argparse
+
+from logic.generator import SyntheticDataGenerator
 
 
 # Функция генерации данных для компании с учетом изменяющейся налоговой ставки
-def generate_company_data(seed=None):
-    if seed is not None:
-        np.random.seed(seed)
-
-    months = np.arange(1, 13)
-    data = pd.DataFrame({
-        'month': months,
-        'profit': np.random.randint(30, 90, size=12),
-        'costs': np.random.randint(20, 70, size=12),
-        'investments': np.random.randint(10, 80, size=12),
-        'market_share': np.random.randint(20, 100, size=12),
-        'economic_stability': np.random.randint(40, 90, size=12),
-        'tax_rate': [20] * 5 + [50] * 2 + [20] * 5  # Повышенная налоговая ставка на 6-7 месяц
-    })
+def generate_company_data(seed=None, company_id=None):
+    data = SyntheticDataGenerator(companies=1, months=12, seed=seed).frame()
+    data['company_id'] = company_id
     return data
 
 
-# Генерация трех различных пакетов данных
-company_data_1 = generate_company_data(seed=42)
-company_data_2 = generate_company_data(seed=99)
-company_data_3 = generate_company_data(seed=123)
+def main():
+    parser = argparse.ArgumentParser(description="Генерация тестовых данных компаний")
+    parser.add_argument('--companies', type=int, help="число компаний (один файл на всех)")
+    parser.add_argument('--months', type=int, default=12, help="число месяцев на компанию")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='companies.csv', help="файл для --companies")
+    parser.add_argument('--workers', type=int, help="число процессов (по умолчанию все ядра)")
+    parser.add_argument('--engine', help="движок оценки для столбца efficiency (skfuzzy, analytic, lookup)")
+    parser.add_argument('--lookup-path', help="файл таблицы для движка lookup")
+    args = parser.parse_args()
+
+    if args.companies is None:
+        # Генерация трех различных пакетов данных, как раньше
+        for number, seed in enumerate((42, 99, 123), start=1):
+            generate_company_data(seed=seed, company_id=f'company_{number}').to_csv(
+                f"company_data_{number}.csv", index=False
+            )
+        return
+
+    generator = SyntheticDataGenerator(args.companies, args.months, seed=args.seed)
+    rows = generator.to_csv(
+        args.output, workers=args.workers, engine=args.engine, lookup_path=args.lookup_path,
+        progress=lambda done: print(f"\r{done}/{generator.rows}", end='', flush=True),
+    )
+    print(f"\nЗаписано строк: {rows} в {args.output}")
 
-# Сохранение данных в CSV
-company_data_1.to_csv("company_data_1.csv", index=False)
-company_data_2.to_csv("company_data_2.csv", index=False)
-company_data_3.to_csv("company_data_3.csv", index=False)
 
-company_data_1.head(), company_data_2.head(), company_data_3.head()
+if __name__ == '__main__':
+    main()
@@ -1,50 +1,351 @@
+from collections import deque
+
 import numpy as np
 import pandas as pd
 
+from data.database import DERIVED_COLUMNS
+from logic.generator import SyntheticDataGenerator
+
+def _trend_stats(n, mean_x, mean_y, sxx, sxy, syy):
+    """Наклон, свободный член, R^2 и ошибка наклона по центрированным суммам МНК.
+
+    sxx, sxy, syy - суммы произведений отклонений от средних. Возвращает
+    словарь массивов n, slope, intercept, r2, stderr (NaN там, где x или y
+    не меняются или точек слишком мало), а также mean_x, mean_y, sxx и
+    resid_std (стандартное отклонение остатков) для интервалов прогноза.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sxx = np.where(sxx > 1e-12 * np.maximum(n, 1), sxx, np.nan)
+        slope = sxy / sxx
+        intercept = mean_y - slope * mean_x
+        syy = np.where(syy > 1e-12 * np.maximum(n, 1), syy, np.nan)
+        r2 = np.clip(sxy * sxy / (sxx * syy), 0.0, 1.0)
+        residual = np.clip(syy - slope * sxy, 0.0, None)
+        resid_std = np.sqrt(residual / np.where(n > 2, n - 2, np.nan))
+        stderr = resid_std / np.sqrt(sxx)
+    return {
+        'n': np.asarray(n).astype(np.int64), 'slope': slope, 'intercept': intercept, 'r2': r2, 'stderr': stderr,
+        'mean_x': mean_x, 'mean_y': mean_y, 'sxx': sxx, 'resid_std': resid_std,
+    }
+
 class DataAnalyzer:
     @staticmethod
-    def generate_test_data():
-        """Генерирует тестовые данные"""
-        months = np.arange(1, 13)
-        return pd.DataFrame({
-            'month': months,
-            'profit': np.random.randint(30, 90, size=12),
-            'costs': np.random.randint(20, 70, size=12),
-            'investments': np.random.randint(10, 80, size=12),
-            'market_share': np.random.randint(20, 100, size=12),
-            'economic_stability': np.random.randint(40, 90, size=12),
-            'tax_rate': [20] * 5 + [50] * 2 + [20] * 5
-        })
+    def generate_test_data(seed=None):
+        """Генерирует тестовые данные (12 месяцев одной компании)"""
+        return SyntheticDataGenerator(companies=1, months=12, seed=seed).frame().drop(columns='company_id')
 
 class TrendAnalyzer:
+    @staticmethod
+    def value_columns(data):
+        """Числовые столбцы показателей (без month, id, идентификаторов и производных столбцов)"""
+        return [column for column in data.select_dtypes('number').columns
+                if column not in ('month', 'id', 'company_id') + DERIVED_COLUMNS]
+
+    @staticmethod
+    def fit_trends(data, x='month', by=None, columns=None):
+        """Линейные тренды всех столбцов (и всех групп) за один проход по данным.
+
+        Для каждого столбца и группы по замкнутым формулам МНК считаются
+        наклон, свободный член, R^2 и стандартная ошибка наклона. Суммы
+        n, x, y, x^2, xy, y^2 накапливаются одним np.bincount по плоскому
+        индексу (группа, столбец), без цикла по группам и столбцам. Пропуски
+        исключаются только из тренда своего столбца.
+
+        by - столбец или список столбцов группировки (компания, год), columns -
+        показатели (по умолчанию все числовые, кроме x и by). Возвращает
+        DataFrame с индексом (группы..., column) и столбцами n, slope,
+        intercept, r2, stderr (и mean_x, mean_y, sxx, resid_std для
+        прогноза, см. logic.forecast); без by индекс - имена столбцов. Если у группы
+        меньше двух разных x, наклон NaN; R^2 и ошибка требуют еще и
+        разброса y и n > 2. Строки без значения текстового ключа (компании)
+        образуют группу '', как в сводных таблицах DatabaseManager; пустые
+        данные дают пустой результат.
+        """
+        keys = [] if by is None else [by] if isinstance(by, str) else list(by)
+        if columns is None:
+            columns = [column for column in TrendAnalyzer.value_columns(data) if column not in keys + [x]]
+        if data.empty:
+            stats = _trend_stats(*[np.empty(0)] * 6)
+            index = (pd.MultiIndex.from_arrays([[]] * (len(keys) + 1), names=keys + ['column']) if keys
+                     else pd.Index([], name='column'))
+            return pd.DataFrame(stats, index=index)
+        if keys:
+            key_values = [data[key] if pd.api.types.is_numeric_dtype(data[key]) else data[key].fillna('')
+                          for key in keys]
+            grouped = data.groupby(key_values, sort=True, dropna=False)
+            codes = grouped.ngroup().to_numpy()
+            groups = grouped.size().index
+        else:
+            codes = np.zeros(len(data), dtype=np.int64)
+            groups = None
+        n_groups = int(codes.max()) + 1 if len(codes) else 0
+
+        xs = data[x].to_numpy(dtype=np.float64)
+        ys = data[columns].to_numpy(dtype=np.float64)
+        # Сдвиг на первую строку уменьшает потерю точности в суммах квадратов
+        # и не меняет наклон и R^2 (свободный член возвращается обратно ниже)
+        x_shift = xs[0] if len(xs) and not np.isnan(xs[0]) else 0.0
+        y_shift = np.nan_to_num(ys[0]) if len(ys) else np.zeros(len(columns))
+        valid = ~np.isnan(ys) & ~np.isnan(xs)[:, None]
+        dx = np.where(valid, (xs - x_shift)[:, None], 0.0)
+        dy = np.where(valid, ys - y_shift, 0.0)
+
+        index = (codes[:, None] * len(columns) + np.arange(len(columns))).ravel()
+        size = n_groups * len(columns)
+
+        def total(weights):
+            return np.bincount(index, weights.ravel(), minlength=size).reshape(n_groups, len(columns))
+
+        n = total(valid.astype(np.float64))
+        sum_x, sum_y = total(dx), total(dy)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_x, mean_y = sum_x / n, sum_y / n
+        stats = _trend_stats(
+            n, mean_x + x_shift, mean_y + y_shift,
+            total(dx * dx) - sum_x * mean_x, total(dx * dy) - sum_x * mean_y, total(dy * dy) - sum_y * mean_y,
+        )
+        if groups is None:
+            return pd.DataFrame({name: values[0] for name, values in stats.items()},
+                                index=pd.Index(columns, name='column'))
+        if not isinstance(groups, pd.MultiIndex):
+            groups = pd.MultiIndex.from_arrays([groups])
+        index = pd.MultiIndex(
+            levels=list(groups.levels) + [pd.Index(columns)],
+            codes=[np.repeat(level_codes, len(columns)) for level_codes in groups.codes]
+            + [np.tile(np.arange(len(columns)), n_groups)],
+            names=list(groups.names) + ['column'],
+        )
+        return pd.DataFrame({name: values.ravel() for name, values in stats.items()}, index=index)
+
+    @staticmethod
+    def fit_from_sums(sums):
+        """Тренды по готовым суммам МНК (DataFrame со столбцами n, mean_x, mean_y, sxx, sxy, syy).
+
+        Суммы дают, например, DatabaseManager.trend_sums или
+        ColumnarResultsStore.trend_sums; индекс сохраняется.
+        """
+        stats = _trend_stats(*(sums[name].to_numpy(dtype=np.float64)
+                               for name in ('n', 'mean_x', 'mean_y', 'sxx', 'sxy', 'syy')))
+        return pd.DataFrame(stats, index=sums.index)
+
     @staticmethod
     def analyze_trends(data):
         """Анализирует тенденции в данных"""
-        trends = {}
-        for column in data.columns[1:]:  # исключаем 'month'
-            x = data['month']
-            y = data[column]
-            coeffs = np.polyfit(x, y, 1)
-            trends[column] = coeffs[0]
-        return trends
+        return TrendAnalyzer.fit_trends(data)['slope'].to_dict()
+
+    @staticmethod
+    def analyze_company_trends(data, by='company_id'):
+        """Наклоны трендов по месяцу для всех компаний сразу (см. fit_trends).
+
+        Возвращает DataFrame: компании x показатели (NaN, если у компании
+        меньше двух разных месяцев).
+        """
+        trends = TrendAnalyzer.fit_trends(data, by=by)
+        slopes = trends['slope'].unstack('column')
+        return slopes[list(trends.index.get_level_values('column').unique())]
+
+class TrendTracker:
+    """Тренды, обновляемые по мере поступления строк, без пересчета истории.
+
+    Для каждого столбца хранятся n, средние x и y и суммы отклонений
+    sxx, sxy, syy (обновление Уэлфорда, O(1) на строку для всех столбцов
+    сразу). Состояния, набранные разными потоками или процессами по своим
+    частям данных, объединяются merge без потери точности; объект можно
+    передавать между процессами через pickle.
+    """
+
+    def __init__(self, columns, x='month'):
+        self.columns = list(columns)
+        self.x = x
+        size = len(self.columns)
+        self.n = np.zeros(size)
+        self.mean_x = np.zeros(size)
+        self.mean_y = np.zeros(size)
+        self.sxx = np.zeros(size)
+        self.sxy = np.zeros(size)
+        self.syy = np.zeros(size)
+
+    def _row(self, row):
+        x = float(row[self.x])
+        y = np.array([row[column] for column in self.columns], dtype=np.float64)
+        return x, y
+
+    def update(self, row):
+        """Добавляет одну строку (словарь или Series с x и столбцами)"""
+        self._add(*self._row(row))
+        return self
+
+    def _add(self, x, y):
+        valid = ~np.isnan(y) & (x == x)
+        n = self.n + valid
+        dx = np.where(valid, x - self.mean_x, 0.0)
+        dy = np.where(valid, y - self.mean_y, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean_x = self.mean_x + np.where(valid, dx / n, 0.0)
+            self.mean_y = self.mean_y + np.where(valid, dy / n, 0.0)
+        self.sxx += dx * np.where(valid, x - self.mean_x, 0.0)
+        self.sxy += dx * np.where(valid, y - self.mean_y, 0.0)
+        self.syy += dy * np.where(valid, y - self.mean_y, 0.0)
+        self.n = n
+
+    def update_batch(self, data):
+        """Добавляет блок строк DataFrame одним векторным расчетом и слиянием"""
+        batch = TrendTracker(self.columns, self.x)
+        xs = data[self.x].to_numpy(dtype=np.float64)
+        ys = data[self.columns].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(ys) & ~np.isnan(xs)[:, None]
+        batch.n = valid.sum(axis=0).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            batch.mean_x = np.where(valid, xs[:, None], 0.0).sum(axis=0) / batch.n
+            batch.mean_y = np.where(valid, ys, 0.0).sum(axis=0) / batch.n
+        dx = np.where(valid, xs[:, None] - batch.mean_x, 0.0)
+        dy = np.where(valid, ys - batch.mean_y, 0.0)
+        batch.sxx, batch.sxy, batch.syy = (dx * dx).sum(axis=0), (dx * dy).sum(axis=0), (dy * dy).sum(axis=0)
+        batch.mean_x, batch.mean_y = np.nan_to_num(batch.mean_x), np.nan_to_num(batch.mean_y)
+        return self.merge(batch)
+
+    def merge(self, other):
+        """Добавляет состояние другого трекера с теми же столбцами (формулы Чана)"""
+        if other.columns != self.columns or other.x != self.x:
+            raise ValueError("Трекеры построены по разным столбцам")
+        n = self.n + other.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(n > 0, self.n * other.n / n, 0.0)
+            share = np.where(n > 0, other.n / n, 0.0)
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        self.sxx = self.sxx + other.sxx + dx * dx * weight
+        self.sxy = self.sxy + other.sxy + dx * dy * weight
+        self.syy = self.syy + other.syy + dy * dy * weight
+        self.mean_x = self.mean_x + dx * share
+        self.mean_y = self.mean_y + dy * share
+        self.n = n
+        return self
+
+    def result(self):
+        """Текущие тренды в формате TrendAnalyzer.fit_trends"""
+        stats = _trend_stats(self.n, self.mean_x, self.mean_y, self.sxx, self.sxy, self.syy)
+        return pd.DataFrame(stats, index=pd.Index(self.columns, name='column'))
+
+    def slopes(self):
+        """Текущие наклоны {столбец: наклон}, как TrendAnalyzer.analyze_trends"""
+        return self.result()['slope'].to_dict()
+
+class RollingTrendTracker(TrendTracker):
+    """Тренды по последним window строкам.
+
+    Новая строка добавляется, а вышедшая из окна вычитается обратным
+    обновлением Уэлфорда, O(1) на строку. Чтобы ошибки округления от
+    вычитаний не накапливались, после каждых window вытеснений состояние
+    пересчитывается по буферу окна (в среднем тоже O(1) на строку).
+    Окна разных потоков не складываются, поэтому merge не поддерживается.
+    """
+
+    def __init__(self, window, columns, x='month'):
+        if window < 1:
+            raise ValueError("Размер окна должен быть положительным")
+        super().__init__(columns, x)
+        self.window = window
+        self._buffer = deque()
+        self._evicted = 0
+
+    def update(self, row):
+        x, y = self._row(row)
+        self._buffer.append((x, y))
+        self._add(x, y)
+        if len(self._buffer) > self.window:
+            self._remove(*self._buffer.popleft())
+            self._evicted += 1
+            if self._evicted >= self.window:
+                self._resync()
+        return self
+
+    def update_batch(self, data):
+        for row in data[[self.x] + self.columns].to_dict('records'):
+            self.update(row)
+        return self
+
+    def _remove(self, x, y):
+        valid = ~np.isnan(y) & (x == x)
+        n = self.n - valid
+        dx = np.where(valid, x - self.mean_x, 0.0)
+        dy = np.where(valid, y - self.mean_y, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_x = np.where(valid & (n > 0), self.mean_x - dx / n, np.where(n > 0, self.mean_x, 0.0))
+            mean_y = np.where(valid & (n > 0), self.mean_y - dy / n, np.where(n > 0, self.mean_y, 0.0))
+        self.sxx -= np.where(valid, (x - mean_x) * dx, 0.0)
+        self.sxy -= np.where(valid, (x - mean_x) * dy, 0.0)
+        self.syy -= np.where(valid, (y - mean_y) * dy, 0.0)
+        empty = n == 0
+        self.sxx[empty] = self.sxy[empty] = self.syy[empty] = 0.0
+        self.mean_x, self.mean_y, self.n = mean_x, mean_y, n
+
+    def _resync(self):
+        """Пересчитывает состояние по строкам окна"""
+        fresh = TrendTracker(self.columns, self.x)
+        for x, y in self._buffer:
+            fresh._add(x, y)
+        self.n, self.mean_x, self.mean_y = fresh.n, fresh.mean_x, fresh.mean_y
+        self.sxx, self.sxy, self.syy = fresh.sxx, fresh.sxy, fresh.syy
+        self._evicted = 0
+
+    def merge(self, other):
+        raise ValueError("Скользящие трекеры не объединяются: окно зависит от порядка строк")
+
+# Правила рекомендаций: (столбец, сравнение, порог, текст). Номер правила в
+# списке - номер бита в маске flags, поэтому новые правила добавляются в конец
+RECOMMENDATION_RULES = [
+    ('efficiency', '<', 30, "Срочно примите меры по повышению эффективности!"),
+    ('costs', '>', 70, "Рекомендуется сократить затраты"),
+    ('investments', '<', 30, "Рассмотрите возможность увеличения инвестиций"),
+    ('market_share', '<', 30, "Разработайте стратегию увеличения доли рынка"),
+    ('tax_rate', '>', 50, "Проконсультируйтесь с налоговым специалистом"),
+]
+
+# Допустимые сравнения правил; DatabaseManager.compute_flags проверяет правила по этому же словарю
+RULE_OPERATORS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal}
 
 class RecommendationEngine:
+    @staticmethod
+    def evaluate_flags(data, rules=RECOMMENDATION_RULES):
+        """Маски сработавших правил для всех строк сразу.
+
+        Бит i установлен, если сработало правило rules[i]; пропуски и
+        отсутствующие столбцы правило не включают. Каждое правило - одно
+        векторное сравнение по всем строкам. Возвращает массив наименьшего
+        беззнакового типа, вмещающего все биты (uint8 для 8 правил).
+        """
+        dtype = np.min_scalar_type((1 << len(rules)) - 1) if rules else np.uint8
+        flags = np.zeros(len(data), dtype=dtype)
+        for bit, (column, operator, threshold, _) in enumerate(rules):
+            if column in data.columns:
+                values = data[column].to_numpy(dtype=np.float64)
+                flags |= RULE_OPERATORS[operator](values, threshold).astype(dtype) << dtype.type(bit)
+        return flags
+
+    @staticmethod
+    def decode_flags(flags, rules=RECOMMENDATION_RULES):
+        """Тексты рекомендаций для одной маски"""
+        return [message for bit, (_, _, _, message) in enumerate(rules) if int(flags) >> bit & 1]
+
+    @staticmethod
+    def flag_counts(data, by=None, rules=RECOMMENDATION_RULES):
+        """Сколько строк нарушает каждое правило: Series или, с by, DataFrame группы x правила"""
+        if 'flags' in data.columns:
+            flags = data['flags'].fillna(0).to_numpy()
+        else:
+            flags = RecommendationEngine.evaluate_flags(data, rules)
+        fired = (flags.astype(np.int64)[:, None] >> np.arange(len(rules))) & 1
+        labels = [f"{column} {operator} {threshold}" for column, operator, threshold, _ in rules]
+        counts = pd.DataFrame(fired, columns=labels, index=data.index)
+        if by is None:
+            return counts.sum()
+        return counts.groupby(data[by]).sum()
+
     @staticmethod
     def generate_recommendations(data):
         """Генерирует рекомендации на основе данных"""
-        recommendations = []
-        last_row = data.iloc[-1] if not data.empty else None
-
-        if last_row is not None:
-            if last_row['efficiency'] < 30:
-                recommendations.append("Срочно примите меры по повышению эффективности!")
-            if last_row['costs'] > 70:
-                recommendations.append("Рекомендуется сократить затраты")
-            if last_row['investments'] < 30:
-                recommendations.append("Рассмотрите возможность увеличения инвестиций")
-            if last_row['market_share'] < 30:
-                recommendations.append("Разработайте стратегию увеличения доли рынка")
-            if last_row['tax_rate'] > 50:
-                recommendations.append("Проконсультируйтесь с налоговым специалистом")
-
-        return recommendations if recommendations else ["Все показатели в норме"]
\ No newline at end of file
+        if data.empty:
+            return ["Все показатели в норме"]
+        flags = RecommendationEngine.evaluate_flags(data.iloc[-1:])[0]
+        return RecommendationEngine.decode_flags(flags) or ["Все показатели в норме"]
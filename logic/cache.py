@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EvaluationCache:
+    """LRU-кэш результатов оценки, ключ - кортеж входных значений.
+
+    При заданном quantum входы округляются до кратных quantum перед
+    вычислением, поэтому близкие значения попадают в одну запись.
+    Все операции защищены блокировкой и безопасны для нескольких потоков.
+    """
+
+    def __init__(self, maxsize=4096, quantum=None):
+        if maxsize <= 0:
+            raise ValueError("Размер кэша должен быть положительным")
+        self.maxsize = maxsize
+        self.quantum = quantum
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def quantize(self, values):
+        """Приводит входы (массив N x 6) к сетке кэша"""
+        values = np.asarray(values, dtype=np.float64)
+        if self.quantum:
+            values = np.round(values / self.quantum) * self.quantum
+        return values
+
+    def get(self, key):
+        """Возвращает сохраненное значение или None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Сохраняет значение, вытесняя самые старые записи"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, keys):
+        """Значения для списка ключей одной блокировкой (None для отсутствующих)"""
+        with self._lock:
+            values = []
+            for key in keys:
+                value = self._entries.get(key)
+                if value is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                values.append(value)
+            return values
+
+    def put_many(self, items):
+        """Сохраняет пары (ключ, значение) одной блокировкой"""
+        with self._lock:
+            for key, value in items:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Очищает кэш и счетчики"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Статистика использования кэша"""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hit_rate': self.hits / requests if requests else 0.0,
+            }
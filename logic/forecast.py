@@ -0,0 +1,146 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from logic.analysis import TrendAnalyzer
+from logic.fuzzy_logic import FuzzyEfficiencySystem, INPUT_NAMES, UNIVERSE
+
+# Число случайных вариантов входов на (компанию, месяц) для интервала эффективности.
+# Границы интервала - выборочные квантили, их разброс между seed убывает как
+# 1/sqrt(samples); 128 вариантов на движке analytic стоят примерно столько же,
+# сколько 64 на skfuzzy
+FORECAST_SAMPLES = 128
+
+
+class EfficiencyForecaster:
+    """Прогноз входов и эффективности по линейным трендам на horizon месяцев вперед.
+
+    Тренды всех компаний считаются одним проходом (TrendAnalyzer.fit_trends
+    или суммы МНК хранилища), прогноз строится массивами компании x месяцы x
+    входы. Интервал входа - интервал предсказания МНК с квантилем Стьюдента;
+    интервал эффективности - квантили оценок samples вариантов входов,
+    выбранных из тех же распределений. Все прогнозные строки оцениваются
+    одним вызовом evaluate_batch. По умолчанию используется движок analytic:
+    оценок здесь в samples раз больше, чем строк прогноза.
+    """
+
+    def __init__(self, system=None, engine='analytic', confidence=0.95, samples=FORECAST_SAMPLES, seed=None):
+        if not 0 < confidence < 1:
+            raise ValueError("Уровень доверия должен быть в интервале (0, 1)")
+        self.system = system if system is not None else FuzzyEfficiencySystem(engine=engine)
+        self.confidence = confidence
+        self.samples = samples
+        self.seed = np.random.SeedSequence(seed).entropy
+
+    def forecast(self, data, horizon=12, by='company_id', x='month'):
+        """Прогноз по DataFrame с историей (столбцы x, входы и, если есть, by).
+
+        Возвращает DataFrame: by, x (месяцы после последнего месяца группы),
+        входы с границами <вход>_lower/<вход>_upper и efficiency с
+        efficiency_lower/efficiency_upper.
+        """
+        if by is not None and by not in data.columns:
+            by = None
+        if by is not None and not pd.api.types.is_numeric_dtype(data[by]):
+            # Строки без компании - группа '', как в fit_trends
+            data = data.assign(**{by: data[by].fillna('')})
+        trends = TrendAnalyzer.fit_trends(data, x=x, by=by, columns=list(INPUT_NAMES))
+        if by is None:
+            trends.index = pd.MultiIndex.from_product([[''], trends.index], names=['company_id', 'column'])
+            last_x = pd.Series([data[x].max()], index=[''])
+        else:
+            last_x = data.groupby(by)[x].max()
+        return self._forecast(trends, last_x, horizon, by or 'company_id', x)
+
+    def forecast_store(self, manager, horizon=12):
+        """Прогноз по всем компаниям хранилища результатов без чтения строк.
+
+        manager - DatabaseManager или ColumnarResultsStore; тренды строятся по
+        их trend_sums (агрегатам по месяцам).
+        """
+        sums = manager.trend_sums()
+        sums = sums[sums.index.get_level_values(-1).isin(INPUT_NAMES)]
+        last_x = sums['last_x'].groupby(level=0).max()
+        return self._forecast(TrendAnalyzer.fit_from_sums(sums), last_x, horizon, 'company_id', 'month')
+
+    def _forecast(self, trends, last_x, horizon, by, x):
+        """trends - результат fit_trends с индексом (группа, вход), last_x - последний x группы"""
+        if horizon < 1:
+            raise ValueError("Горизонт прогноза должен быть положительным")
+        groups = trends.index.get_level_values(0).unique()
+        stats = {name: trends[name].unstack(-1).reindex(index=groups, columns=list(INPUT_NAMES)).to_numpy()
+                 for name in ('n', 'slope', 'intercept', 'mean_x', 'mean_y', 'sxx', 'resid_std')}
+        # x прогноза: группы x месяцы
+        future = last_x.reindex(groups).to_numpy(dtype=np.float64)[:, None] + np.arange(1, horizon + 1)
+        value, scale, df = self._project(stats, future)
+
+        half = scale * self._t_quantile(df)[:, None, :]
+        lower = np.clip(value - half, UNIVERSE[0], UNIVERSE[-1])
+        upper = np.clip(value + half, UNIVERSE[0], UNIVERSE[-1])
+        value = np.clip(value, UNIVERSE[0], UNIVERSE[-1])
+
+        efficiency, efficiency_lower, efficiency_upper = self._score(value, scale, df)
+
+        result = {
+            by: np.repeat(groups.to_numpy(), horizon),
+            x: future.ravel().astype(np.int64),
+        }
+        for i, name in enumerate(INPUT_NAMES):
+            result[name] = value[:, :, i].ravel()
+            result[f'{name}_lower'] = lower[:, :, i].ravel()
+            result[f'{name}_upper'] = upper[:, :, i].ravel()
+        result['efficiency'] = efficiency
+        result['efficiency_lower'] = efficiency_lower
+        result['efficiency_upper'] = efficiency_upper
+        return pd.DataFrame(result)
+
+    @staticmethod
+    def _project(stats, future):
+        """Точечный прогноз, масштаб ошибки предсказания и число степеней свободы.
+
+        Массивы групп x месяцы x входы. Без наклона (один месяц в истории)
+        прогноз равен среднему, ошибка неизвестна (NaN); постоянный вход
+        прогнозируется без разброса.
+        """
+        n, slope, intercept = stats['n'], stats['slope'], stats['intercept']
+        x0 = future[:, :, None]
+        value = np.where(np.isnan(slope)[:, None, :], stats['mean_y'][:, None, :],
+                         intercept[:, None, :] + slope[:, None, :] * x0)
+        resid_std = stats['resid_std']
+        resid_std = np.where(np.isnan(resid_std) & (n > 2) & ~np.isnan(slope), 0.0, resid_std)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            leverage = 1 + 1 / n[:, None, :] + (x0 - stats['mean_x'][:, None, :]) ** 2 / stats['sxx'][:, None, :]
+            scale = resid_std[:, None, :] * np.sqrt(leverage)
+        df = np.where(n > 2, n - 2, np.nan)
+        return value, scale, df
+
+    def _t_quantile(self, df):
+        # scipy приходит вместе с skfuzzy, импортируется только при прогнозе
+        from scipy.stats import t
+        return t.ppf(0.5 + self.confidence / 2, df)
+
+    def _score(self, value, scale, df):
+        """Оценка центрального прогноза и samples вариантов входов одним пакетом"""
+        groups, horizon, inputs = value.shape
+        rng = np.random.default_rng(self.seed)
+        noise = rng.standard_t(np.nan_to_num(df, nan=1.0)[:, None, None, :],
+                               size=(groups, horizon, self.samples, inputs))
+        draws = value[:, :, None, :] + np.nan_to_num(scale)[:, :, None, :] * noise
+        draws = np.clip(draws, UNIVERSE[0], UNIVERSE[-1])
+
+        rows = np.concatenate([value.reshape(-1, inputs), draws.reshape(-1, inputs)])
+        valid = ~np.isnan(rows).any(axis=1)
+        scores = np.full(len(rows), np.nan)
+        scores[valid] = self.system.evaluate_batch(rows[valid])
+
+        central = scores[:groups * horizon]
+        sampled = scores[groups * horizon:].reshape(groups * horizon, self.samples)
+        if not len(sampled):
+            return central, central.copy(), central.copy()
+        tail = (1 - self.confidence) / 2
+        with warnings.catch_warnings():
+            # Строки, где не оценен ни один вариант, получают NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            lower, upper = np.nanquantile(sampled, [tail, 1 - tail], axis=1)
+        return central, lower, upper
@@ -1,52 +1,481 @@
+import hashlib
+import json
+import os
+import queue
+import warnings
+from contextlib import contextmanager
+
 import numpy as np
-import skfuzzy as fuzz
-import skfuzzy.control as ctrl
+
+from logic.cache import EvaluationCache
+
+# Входные переменные в порядке столбцов для пакетной оценки
+INPUT_NAMES = ('profit', 'costs', 'investments', 'market_share', 'economic_stability', 'tax_rate')
+
+# Параметры треугольных функций принадлежности (общие для входов и выхода)
+TERMS = {
+    'low': (0, 0, 50),
+    'medium': (25, 50, 75),
+    'high': (50, 100, 100),
+}
+
+UNIVERSE = np.arange(0, 101, 1)
+
+# Правила в дизъюнктивной форме: (список конъюнкций, терм эффективности).
+# Шестое правило tax_rate['high'] & (profit['medium'] | profit['low']) раскрыто
+# по дистрибутивности min/max, результат совпадает с исходной записью.
+RULES = (
+    ([(('profit', 'high'), ('costs', 'low'), ('investments', 'medium'),
+       ('market_share', 'high'), ('economic_stability', 'high'), ('tax_rate', 'low'))], 'high'),
+    ([(('profit', 'medium'), ('costs', 'medium'), ('investments', 'high'),
+       ('market_share', 'medium'), ('economic_stability', 'medium'), ('tax_rate', 'medium'))], 'medium'),
+    ([(('profit', 'low'),), (('costs', 'high'),), (('investments', 'low'),),
+      (('market_share', 'low'),), (('economic_stability', 'low'),), (('tax_rate', 'high'),)], 'low'),
+    ([(('profit', 'high'), ('costs', 'low'), ('investments', 'high'))], 'high'),
+    ([(('profit', 'high'), ('market_share', 'high'), ('economic_stability', 'medium'))], 'high'),
+    ([(('tax_rate', 'high'), ('profit', 'medium')), (('tax_rate', 'high'), ('profit', 'low'))], 'low'),
+)
+
+# Версия формата скомпилированной базы правил (входит в отпечаток)
+COMPILED_FORMAT = 1
+
+# Каталог кэша скомпилированной базы правил
+RULE_BASE_CACHE_DIR = os.environ.get(
+    'EFFICIENCY_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'efficiency'))
+
+# Размер блока строк при пакетной оценке (ограничивает пиковую память)
+BATCH_CHUNK_SIZE = 65536
+
+# Движки вычисления: 'skfuzzy' - дискретный универсум skfuzzy,
+# 'analytic' - точные формулы для треугольных функций без универсума,
+# 'lookup' - интерполяция по предвычисленной таблице (logic.lookup)
+ENGINES = ('skfuzzy', 'analytic', 'lookup')
+
+# Максимальное расхождение движков 'analytic' и 'skfuzzy' (в единицах эффективности).
+# skfuzzy не добавляет в универсум точки пересечения соседних термов выхода,
+# поэтому его центроид немного отличается от точного.
+ANALYTIC_TOLERANCE = 0.05
+
+# Допустимая максимальная погрешность таблицы движка 'lookup' (в единицах
+# эффективности). Интерполяция ошибается сильнее всего у границ областей, где
+# меняется набор сработавших правил, и более частая сетка это почти не
+# исправляет: для 9, 13 и 17 узлов на ось максимум около 20, 16 и 14 при
+# средней ошибке 0.6, 0.3 и 0.2. Таблица с большей или неизмеренной
+# погрешностью открывается с предупреждением.
+LOOKUP_MAX_ERROR = 5.0
+
+
+class _SimulationPool:
+    """Пул независимых симуляций skfuzzy: каждый вызов получает свою копию.
+
+    ControlSystemSimulation хранит входы и промежуточные состояния в объектах
+    правил, поэтому у каждой симуляции в пуле собственная система правил.
+    Новые копии создаются по требованию, их число равно пиковому числу
+    одновременных вызовов.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._idle = queue.SimpleQueue()
+
+    @contextmanager
+    def checkout(self):
+        try:
+            simulation = self._idle.get_nowait()
+        except queue.Empty:
+            simulation = self._factory()
+        try:
+            yield simulation
+        finally:
+            self._idle.put(simulation)
 
 
 class FuzzyEfficiencySystem:
-    def __init__(self):
-        self.system = self._create_system()
+    """Нечеткая оценка эффективности.
+
+    Экземпляр можно использовать из нескольких потоков: движок 'skfuzzy'
+    берет симуляцию из пула на время вызова, остальные движки и пакетная
+    оценка - чистые функции над таблицей правил, кэш защищен блокировкой.
+    Система skfuzzy строится при первом скалярном вызове или в warm_up.
+    """
+
+    def __init__(self, engine='skfuzzy', lookup_path=None, cache_size=0, cache_quantum=None,
+                 lookup_max_error=LOOKUP_MAX_ERROR):
+        if engine not in ENGINES:
+            raise ValueError(f"Неизвестный движок: {engine}. Допустимые: {', '.join(ENGINES)}")
+        self.engine = engine
+        self._simulations = _SimulationPool(self._create_system)
+        # Векторные движки работают по скомпилированной базе правил, skfuzzy им не нужен
+        self.rule_base = load_rule_base() if engine != 'lookup' else None
+        self.lookup_table = None
+        if engine == 'lookup':
+            if lookup_path is None:
+                raise ValueError("Для движка 'lookup' нужно указать lookup_path")
+            from logic.lookup import EfficiencyLookupTable
+            self.lookup_table = EfficiencyLookupTable.load(lookup_path)
+            # lookup_max_error=None - погрешность заведомо приемлема, без проверки
+            max_error = self.lookup_table.max_error
+            if lookup_max_error is not None and (max_error is None or max_error > lookup_max_error):
+                measured = "не измерена" if max_error is None else f"до {max_error:.1f}"
+                warnings.warn(
+                    f"Погрешность таблицы {lookup_path} {measured} при допустимой {lookup_max_error}: "
+                    "движок 'lookup' заметно расходится с evaluate",
+                    RuntimeWarning, stacklevel=2,
+                )
+        # LRU-кэш результатов (0 - без кэша)
+        self.cache = EvaluationCache(cache_size, cache_quantum) if cache_size else None
+
+    def warm_up(self):
+        """Заранее строит симуляцию skfuzzy, чтобы первый вызов evaluate не ждал"""
+        if self.engine == 'skfuzzy':
+            with self._simulations.checkout():
+                pass
 
     def _create_system(self):
+        # skfuzzy тянет scipy и networkx, поэтому импортируется только здесь
+        import skfuzzy as fuzz
+        import skfuzzy.control as ctrl
+
         # Входные переменные
-        profit = ctrl.Antecedent(np.arange(0, 101, 1), 'profit')
-        costs = ctrl.Antecedent(np.arange(0, 101, 1), 'costs')
-        investments = ctrl.Antecedent(np.arange(0, 101, 1), 'investments')
-        market_share = ctrl.Antecedent(np.arange(0, 101, 1), 'market_share')
-        economic_stability = ctrl.Antecedent(np.arange(0, 101, 1), 'economic_stability')
-        tax_rate = ctrl.Antecedent(np.arange(0, 101, 1), 'tax_rate')
+        inputs = {name: ctrl.Antecedent(UNIVERSE, name) for name in INPUT_NAMES}
 
         # Выходная переменная
-        efficiency = ctrl.Consequent(np.arange(0, 101, 1), 'efficiency')
+        efficiency = ctrl.Consequent(UNIVERSE, 'efficiency')
 
         # Функции принадлежности
-        for var in [profit, costs, investments, market_share, economic_stability, tax_rate]:
-            var['low'] = fuzz.trimf(var.universe, [0, 0, 50])
-            var['medium'] = fuzz.trimf(var.universe, [25, 50, 75])
-            var['high'] = fuzz.trimf(var.universe, [50, 100, 100])
-
-        efficiency['low'] = fuzz.trimf(efficiency.universe, [0, 0, 50])
-        efficiency['medium'] = fuzz.trimf(efficiency.universe, [25, 50, 75])
-        efficiency['high'] = fuzz.trimf(efficiency.universe, [50, 100, 100])
+        for var in list(inputs.values()) + [efficiency]:
+            for term, params in TERMS.items():
+                var[term] = fuzz.trimf(var.universe, list(params))
 
         # Правила
-        rules = [
-            ctrl.Rule(profit['high'] & costs['low'] & investments['medium'] &
-                      market_share['high'] & economic_stability['high'] & tax_rate['low'], efficiency['high']),
-            ctrl.Rule(profit['medium'] & costs['medium'] & investments['high'] &
-                      market_share['medium'] & economic_stability['medium'] & tax_rate['medium'], efficiency['medium']),
-            ctrl.Rule(profit['low'] | costs['high'] | investments['low'] |
-                      market_share['low'] | economic_stability['low'] | tax_rate['high'], efficiency['low']),
-            ctrl.Rule(profit['high'] & costs['low'] & investments['high'], efficiency['high']),
-            ctrl.Rule(profit['high'] & market_share['high'] & economic_stability['medium'], efficiency['high']),
-            ctrl.Rule(tax_rate['high'] & (profit['medium'] | profit['low']), efficiency['low'])
-        ]
+        rules = []
+        for clauses, consequent in RULES:
+            antecedent = None
+            for clause in clauses:
+                term = None
+                for name, label in clause:
+                    term = inputs[name][label] if term is None else term & inputs[name][label]
+                antecedent = term if antecedent is None else antecedent | term
+            rules.append(ctrl.Rule(antecedent, efficiency[consequent]))
 
         return ctrl.ControlSystemSimulation(ctrl.ControlSystem(rules))
 
     def evaluate(self, inputs):
         """Вычисляет эффективность на основе входных параметров"""
-        for key, value in inputs.items():
-            self.system.input[key] = value
-        self.system.compute()
-        return self.system.output['efficiency']
\ No newline at end of file
+        values = np.array([[inputs[name] for name in INPUT_NAMES]], dtype=np.float64)
+        if self.cache is None:
+            return self._evaluate_one(values)
+
+        values = self.cache.quantize(values)
+        key = tuple(values[0])
+        efficiency = self.cache.get(key)
+        if efficiency is None:
+            efficiency = self._evaluate_one(values)
+            self.cache.put(key, efficiency)
+        return efficiency
+
+    def cache_stats(self):
+        """Счетчики кэша (hits, misses, evictions, size) или None, если кэш выключен"""
+        return self.cache.stats() if self.cache is not None else None
+
+    def _evaluate_one(self, values):
+        """Оценка одной строки (массив 1 x 6)"""
+        if self.engine == 'skfuzzy':
+            with self._simulations.checkout() as simulation:
+                for name, value in zip(INPUT_NAMES, values[0]):
+                    simulation.input[name] = value
+                simulation.compute()
+                return simulation.output['efficiency']
+
+        efficiency = self._evaluate_values(values)[0]
+        if np.isnan(efficiency):
+            raise ValueError("Ни одно правило не сработало, эффективность не определена")
+        return float(efficiency)
+
+    def evaluate_batch(self, data):
+        """Вычисляет эффективность для набора строк (DataFrame или массив N x 6).
+
+        Для DataFrame возвращает столбец 'efficiency' с тем же индексом, для массива -
+        одномерный массив. Строки, в которых не сработало ни одно правило, получают NaN
+        (скалярный evaluate в этом случае выбрасывает исключение).
+        """
+        if hasattr(data, 'columns'):
+            values = data[list(INPUT_NAMES)].to_numpy(dtype=np.float64)
+        else:
+            values = np.asarray(data, dtype=np.float64)
+        if values.ndim != 2 or values.shape[1] != len(INPUT_NAMES):
+            raise ValueError(f"Ожидается {len(INPUT_NAMES)} столбцов: {', '.join(INPUT_NAMES)}")
+
+        result = np.empty(len(values), dtype=np.float64)
+        for start in range(0, len(values), BATCH_CHUNK_SIZE):
+            chunk = values[start:start + BATCH_CHUNK_SIZE]
+            if self.cache is not None:
+                result[start:start + len(chunk)] = self._evaluate_cached(chunk)
+            else:
+                result[start:start + len(chunk)] = self._evaluate_values(chunk)
+
+        if hasattr(data, 'columns'):
+            import pandas as pd
+            return pd.Series(result, index=data.index, name='efficiency')
+        return result
+
+    def _evaluate_cached(self, values):
+        """Пакетная оценка через кэш: повторяющиеся строки считаются один раз.
+
+        Если уникальных строк в блоке больше размера кэша, записи все равно
+        вытеснили бы друг друга, поэтому блок оценивается без обращений к кэшу.
+        """
+        values = self.cache.quantize(values)
+        unique, inverse = np.unique(values, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        if len(unique) > self.cache.maxsize:
+            return self._evaluate_values(unique)[inverse]
+
+        keys = [tuple(row) for row in unique.tolist()]
+        cached = self.cache.get_many(keys)
+        missing = [i for i, value in enumerate(cached) if value is None]
+        result = np.array([np.nan if value is None else value for value in cached], dtype=np.float64)
+        if missing:
+            result[missing] = self._evaluate_values(unique[missing])
+            self.cache.put_many((keys[i], float(result[i])) for i in missing)
+        return result[inverse]
+
+    def _evaluate_values(self, values):
+        """Оценка блока строк N x 6 выбранным движком"""
+        if self.engine == 'lookup':
+            return self.lookup_table.evaluate_batch(values)
+        rb = self.rule_base
+        if self.engine == 'analytic':
+            return _defuzzify_exact(_fire_rules(_fuzzify_exact(values, rb), rb), rb)
+        return _defuzzify(_fire_rules(_fuzzify(values, rb), rb), rb)
+
+
+class CompiledRuleBase:
+    """База правил в виде плоских массивов для векторной оценки.
+
+    Литералы правил хранятся как пары индексов (вход, терм), сгруппированные
+    по конъюнкциям (clause_start), конъюнкции - по правилам (rule_start).
+    Массивы сохраняются в .npz вместе с отпечатком определений TERMS, RULES
+    и INPUT_NAMES; при изменении правил отпечаток меняется и база собирается заново.
+    """
+
+    FIELDS = ('universe', 'input_params', 'output_params', 'literal_input', 'literal_term',
+              'clause_start', 'rule_start', 'rule_consequent', 'edges', 'crossings')
+
+    def __init__(self, fingerprint, **arrays):
+        self.fingerprint = fingerprint
+        for field in self.FIELDS:
+            setattr(self, field, arrays[field])
+
+    @classmethod
+    def compile(cls):
+        """Собирает массивы из определений модуля"""
+        term_index = {term: k for k, term in enumerate(TERMS)}
+        input_index = {name: i for i, name in enumerate(INPUT_NAMES)}
+        params = np.array(list(TERMS.values()), dtype=np.float64)
+
+        literal_input, literal_term, clause_start, rule_start, rule_consequent = [], [], [], [], []
+        for clauses, consequent in RULES:
+            rule_start.append(len(clause_start))
+            rule_consequent.append(term_index[consequent])
+            for clause in clauses:
+                clause_start.append(len(literal_input))
+                for name, term in clause:
+                    literal_input.append(input_index[name])
+                    literal_term.append(term_index[term])
+
+        edges = _term_edges(params)
+        return cls(
+            rules_fingerprint(),
+            universe=UNIVERSE.astype(np.float64),
+            input_params=np.broadcast_to(params, (len(INPUT_NAMES),) + params.shape).copy(),
+            output_params=params,
+            literal_input=np.array(literal_input, dtype=np.intp),
+            literal_term=np.array(literal_term, dtype=np.intp),
+            clause_start=np.array(clause_start, dtype=np.intp),
+            rule_start=np.array(rule_start, dtype=np.intp),
+            rule_consequent=np.array(rule_consequent, dtype=np.intp),
+            edges=edges,
+            crossings=_edge_crossings(params, edges),
+        )
+
+    def save(self, path):
+        """Атомарно записывает массивы в .npz"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, fingerprint=self.fingerprint, **{field: getattr(self, field) for field in self.FIELDS})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(str(data['fingerprint']), **{field: data[field] for field in cls.FIELDS})
+
+
+def rules_fingerprint():
+    """Отпечаток определений правил и функций принадлежности"""
+    definition = json.dumps([COMPILED_FORMAT, INPUT_NAMES, TERMS, RULES,
+                             [int(UNIVERSE[0]), int(UNIVERSE[-1]), len(UNIVERSE)]])
+    return hashlib.sha256(definition.encode()).hexdigest()[:16]
+
+
+def load_rule_base(cache_dir=None):
+    """Возвращает скомпилированную базу правил, используя кэш на диске.
+
+    Файл rule_base_<отпечаток>.npz ищется в cache_dir (по умолчанию
+    RULE_BASE_CACHE_DIR); если его нет или он поврежден, база собирается и
+    сохраняется. В пределах процесса результат переиспользуется.
+    """
+    global _rule_base
+    if _rule_base is not None and cache_dir is None:
+        return _rule_base
+
+    fingerprint = rules_fingerprint()
+    path = os.path.join(cache_dir or RULE_BASE_CACHE_DIR, f"rule_base_{fingerprint}.npz")
+    rule_base = None
+    if os.path.exists(path):
+        try:
+            rule_base = CompiledRuleBase.load(path)
+        except (OSError, ValueError, KeyError):
+            rule_base = None
+    if rule_base is None or rule_base.fingerprint != fingerprint:
+        rule_base = CompiledRuleBase.compile()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            rule_base.save(path)
+        except OSError:
+            pass  # каталог кэша недоступен - работаем без него
+
+    if cache_dir is None:
+        _rule_base = rule_base
+    return rule_base
+
+
+_rule_base = None
+
+
+def _fuzzify(values, rb):
+    """Степени принадлежности входов N x входы x термы, как в skfuzzy"""
+    memberships = np.empty((len(values),) + rb.input_params.shape[:2])
+    for i in range(rb.input_params.shape[0]):
+        for k in range(rb.input_params.shape[1]):
+            # Интерполяция по универсуму (значения вне 0-100 прижимаются к краям)
+            memberships[:, i, k] = np.interp(values[:, i], rb.universe, _trimf(rb.universe, rb.input_params[i, k]))
+    return memberships
+
+
+def _fuzzify_exact(values, rb):
+    """Степени принадлежности входов по формулам треугольных функций"""
+    values = np.clip(values, rb.universe[0], rb.universe[-1])
+    memberships = np.empty((len(values),) + rb.input_params.shape[:2])
+    for i in range(rb.input_params.shape[0]):
+        for k in range(rb.input_params.shape[1]):
+            memberships[:, i, k] = _trimf(values[:, i], rb.input_params[i, k])
+    return memberships
+
+
+def _fire_rules(memberships, rb):
+    """Активация термов выхода N x термы: AND = min, OR = max, накопление правил = max"""
+    literals = memberships[:, rb.literal_input, rb.literal_term]
+    clauses = np.minimum.reduceat(literals, rb.clause_start, axis=1)
+    rules = np.maximum.reduceat(clauses, rb.rule_start, axis=1)
+    activation = np.zeros((len(memberships), len(rb.output_params)))
+    for k in range(len(rb.output_params)):
+        fired = rules[:, rb.rule_consequent == k]
+        if fired.shape[1]:
+            activation[:, k] = fired.max(axis=1)
+    return activation
+
+
+def _trimf(x, params):
+    """Треугольная функция принадлежности, вычисленная поэлементно"""
+    a, b, c = params
+    y = np.zeros_like(x, dtype=np.float64)
+    if b > a:
+        rising = (x > a) & (x < b)
+        y[rising] = (x[rising] - a) / (b - a)
+    if c > b:
+        falling = (x > b) & (x < c)
+        y[falling] = (c - x[falling]) / (c - b)
+    y[x == b] = 1.0
+    return y
+
+
+def _centroid(x, mf):
+    """Центроид кусочно-линейных функций, заданных точками x, mf (по строкам)"""
+    # Площадь и момент каждой трапеции между соседними точками
+    dx = np.diff(x, axis=1)
+    y1, y2 = mf[:, :-1], mf[:, 1:]
+    area = 0.5 * dx * (y1 + y2)
+    moment = area * x[:, :-1] + dx * dx * (y1 + 2.0 * y2) / 6.0
+    total_area = area.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total_area > 0, moment.sum(axis=1) / total_area, np.nan)
+
+
+def _aggregate(x, activation, rb):
+    """Значения агрегированной функции выхода в точках x"""
+    mf = np.zeros_like(x)
+    for k, params in enumerate(rb.output_params):
+        np.maximum(mf, np.minimum(activation[:, k:k + 1], _trimf(x, params)), out=mf)
+    return mf
+
+
+def _defuzzify(activation, rb):
+    """Центроид агрегированного выхода так же, как в skfuzzy.
+
+    skfuzzy дополняет универсум точками, где функции принадлежности пересекают
+    уровни отсечения, и считает центроид кусочно-линейной функции. Здесь то же
+    самое делается сразу для всех строк: к общему универсуму добавляются по две
+    точки на терм (дубликаты дают отрезки нулевой ширины и не влияют на результат).
+    """
+    n = len(activation)
+    cut_points = []
+    for k, (a, b, c) in enumerate(rb.output_params):
+        if b > a:
+            cut_points.append(a + activation[:, k] * (b - a))
+        if c > b:
+            cut_points.append(c - activation[:, k] * (c - b))
+    x = np.concatenate([np.broadcast_to(rb.universe, (n, len(rb.universe))),
+                        np.column_stack(cut_points)], axis=1)
+    x.sort(axis=1)
+    return _centroid(x, _aggregate(x, activation, rb))
+
+
+def _term_edges(params):
+    """Наклонные стороны треугольников выхода в виде (x при y=0, x при y=1)"""
+    edges = []
+    for a, b, c in params:
+        if b > a:
+            edges.append((a, b))
+        if c > b:
+            edges.append((c, b))
+    return np.array(edges, dtype=np.float64)
+
+
+def _edge_crossings(params, edges):
+    """Точки пересечения сторон разных треугольников (не зависят от входов)"""
+    points = [float(p) for p in params.ravel()]
+    for i, (x0, x1) in enumerate(edges):
+        for u0, u1 in edges[i + 1:]:
+            # y = (x - x0) / (x1 - x0) = (x - u0) / (u1 - u0)
+            k1, k2 = 1.0 / (x1 - x0), 1.0 / (u1 - u0)
+            if k1 != k2:
+                points.append((x0 * k1 - u0 * k2) / (k1 - k2))
+    return np.unique(np.clip(points, UNIVERSE[0], UNIVERSE[-1]))
+
+
+def _defuzzify_exact(activation, rb):
+    """Точный центроид объединения усеченных треугольников.
+
+    Агрегированная функция кусочно-линейна, а ее изломы лежат только в вершинах
+    треугольников, в точках пересечения их сторон и в точках, где стороны
+    достигают уровней отсечения. Центроид по этим ~20 точкам совпадает с
+    интегралом в замкнутой форме, дискретный универсум не нужен.
+    """
+    n = len(activation)
+    level_points = [x0 + activation * (x1 - x0) for x0, x1 in rb.edges]
+    x = np.concatenate([np.broadcast_to(rb.crossings, (n, len(rb.crossings)))] + level_points, axis=1)
+    np.clip(x, rb.universe[0], rb.universe[-1], out=x)
+    x.sort(axis=1)
+    return _centroid(x, _aggregate(x, activation, rb))
@@ -0,0 +1,153 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from logic.parallel import ordered_map, worker_system
+
+# Распределения входов по умолчанию: (low, high) - целые равномерно из [low, high),
+# как в исходном генераторе. Вместо пары можно передать функцию (rng, size) -> массив;
+# функции, которые нельзя передать в процессы пула (lambda, вложенные), генерируются
+# в текущем процессе
+DEFAULT_DISTRIBUTIONS = {
+    'profit': (30, 90),
+    'costs': (20, 70),
+    'investments': (10, 80),
+    'market_share': (20, 100),
+    'economic_stability': (40, 90),
+}
+
+# Налоговые режимы внутри года: (ставка, число месяцев); повышенная ставка на 6-7 месяц
+DEFAULT_TAX_REGIME = ((20, 5), (50, 2), (20, 5))
+
+# Примерное число строк в одном блоке генерации. Разбиение на блоки не зависит
+# от числа процессов, поэтому результат при одном seed всегда одинаков
+BLOCK_ROWS = 1000000
+
+
+class SyntheticDataGenerator:
+    """Воспроизводимый генератор данных N компаний x M месяцев.
+
+    Данные строятся блоками целых компаний; у каждого блока свой поток
+    случайных чисел np.random.Generator от SeedSequence(seed) с ключом
+    номера блока, поэтому блоки генерируются независимо (в том числе в
+    разных процессах) и не зависят от порядка и числа исполнителей. Налоговая
+    ставка задается режимами внутри года и повторяется каждые 12 месяцев
+    (или длину tax_regime). С engine блоки сразу оцениваются
+    FuzzyEfficiencySystem и получают столбец efficiency; для движка lookup
+    нужен lookup_path.
+    """
+
+    def __init__(self, companies=1, months=12, seed=None, distributions=None, tax_regime=DEFAULT_TAX_REGIME,
+                 company_prefix='company_'):
+        if companies < 1 or months < 1:
+            raise ValueError("Число компаний и месяцев должно быть положительным")
+        self.companies = companies
+        self.months = months
+        # Без seed энтропия выбирается один раз, и все блоки остаются согласованными
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.distributions = dict(DEFAULT_DISTRIBUTIONS if distributions is None else distributions)
+        self.tax_cycle = np.concatenate([np.full(length, rate, dtype=np.int64) for rate, length in tax_regime])
+        self.company_prefix = company_prefix
+        self.block_companies = max(1, BLOCK_ROWS // months)
+
+    @property
+    def rows(self):
+        return self.companies * self.months
+
+    @property
+    def n_blocks(self):
+        return -(-self.companies // self.block_companies)
+
+    def block(self, index):
+        """Блок index: DataFrame компаний [index * block_companies, ...) по всем месяцам"""
+        first = index * self.block_companies
+        count = min(self.block_companies, self.companies - first)
+        if count <= 0:
+            raise IndexError(f"Нет блока {index}")
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(index,)))
+        size = count * self.months
+
+        companies = np.repeat(np.arange(first + 1, first + count + 1), self.months)
+        width = len(str(self.companies))
+        months = np.tile(np.arange(1, self.months + 1), count)
+        data = {
+            'company_id': np.char.add(self.company_prefix, np.char.zfill(companies.astype(str), width)),
+            'month': months,
+        }
+        for column, spec in self.distributions.items():
+            if callable(spec):
+                data[column] = spec(rng, size)
+            else:
+                data[column] = rng.integers(spec[0], spec[1], size=size)
+        data['tax_rate'] = self.tax_cycle[(months - 1) % len(self.tax_cycle)]
+        return pd.DataFrame(data)
+
+    def frame(self, engine=None, lookup_path=None):
+        """Все данные одним DataFrame (для небольших объемов)"""
+        return pd.concat(list(self.blocks(workers=1, engine=engine, lookup_path=lookup_path)), ignore_index=True)
+
+    def blocks(self, workers=None, engine=None, lookup_path=None):
+        """Блоки по порядку; при workers != 1 генерируются пулом процессов (см. ordered_map)"""
+        yield from self._run(_generate_block, workers, engine, lookup_path)
+
+    def _run(self, task, workers, engine, lookup_path):
+        if workers != 1 and not self._picklable():
+            workers = 1
+        return ordered_map(task, [(self, index) for index in range(self.n_blocks)], workers, engine, lookup_path)
+
+    def _picklable(self):
+        """Можно ли передать генератор в процессы пула (распределения-lambda нельзя)"""
+        try:
+            pickle.dumps(self.distributions)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            return False
+        return True
+
+    def to_csv(self, filename, workers=None, engine=None, progress=None, lookup_path=None):
+        """Записывает данные в CSV потоково; текст блоков готовят процессы пула.
+
+        progress(rows_done) вызывается после каждого блока. Возвращает число строк.
+        """
+        total = 0
+        with open(filename, 'w', newline='') as f:
+            for index, text in enumerate(self._run(_render_block, workers, engine, lookup_path)):
+                if index == 0:
+                    f.write(','.join(self._columns(engine)) + '\n')
+                f.write(text)
+                total = min(self.rows, (index + 1) * self.block_companies * self.months)
+                if progress is not None:
+                    progress(total)
+        return total
+
+    def to_db(self, manager, workers=None, engine='analytic', progress=None, lookup_path=None):
+        """Сохраняет данные в хранилище результатов блоками (нужна оценка engine).
+
+        manager - DatabaseManager или ColumnarResultsStore; каждый блок
+        записывается своим save_results. Возвращает число добавленных строк.
+        """
+        if engine is None:
+            raise ValueError("Для записи в базу нужна оценка эффективности (engine)")
+        written = rows_done = 0
+        for data in self.blocks(workers, engine, lookup_path):
+            written += manager.save_results(data)[0]
+            rows_done += len(data)
+            if progress is not None:
+                progress(rows_done)
+        return written
+
+    def _columns(self, engine):
+        columns = ['company_id', 'month'] + list(self.distributions) + ['tax_rate']
+        return columns + ['efficiency'] if engine is not None else columns
+
+
+def _generate_block(generator, index):
+    data = generator.block(index)
+    system = worker_system()
+    if system is not None:
+        data['efficiency'] = system.evaluate_batch(data)
+    return data
+
+
+def _render_block(generator, index):
+    return _generate_block(generator, index).to_csv(header=False, index=False)
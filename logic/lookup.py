@@ -0,0 +1,124 @@
+import json
+import os
+from itertools import product
+
+import numpy as np
+
+from logic.fuzzy_logic import BATCH_CHUNK_SIZE, FuzzyEfficiencySystem, INPUT_NAMES, UNIVERSE
+
+# Число узлов сетки по каждому входу: шаг 12.5 попадает во все вершины треугольников.
+# Максимальная погрешность такой таблицы около 20 пунктов (средняя 0.6), поэтому
+# FuzzyEfficiencySystem открывает ее с предупреждением (см. LOOKUP_MAX_ERROR)
+DEFAULT_POINTS = 9
+
+
+class EfficiencyLookupTable:
+    """Предвычисленная таблица эффективности на 6-мерной сетке.
+
+    Таблица хранится в .npy файле (открывается через memory-map), рядом лежит
+    .json с числом узлов и измеренной погрешностью. Значения между узлами
+    восстанавливаются полилинейной интерполяцией по 64 соседним узлам.
+    """
+
+    def __init__(self, table, max_error=None, mean_error=None):
+        self.table = table
+        self.points = table.shape[0]
+        self.max_error = max_error
+        self.mean_error = mean_error
+        self._flat = table.reshape(-1)
+        self._strides = np.array([self.points ** (len(INPUT_NAMES) - 1 - i)
+                                  for i in range(len(INPUT_NAMES))], dtype=np.int64)
+        self._corner_offsets = np.array(list(product((0, 1), repeat=len(INPUT_NAMES)))) @ self._strides
+
+    @staticmethod
+    def grid(points=DEFAULT_POINTS):
+        """Узлы сетки по одной оси"""
+        return np.linspace(UNIVERSE[0], UNIVERSE[-1], points)
+
+    @classmethod
+    def build(cls, path, points=DEFAULT_POINTS, engine='analytic', error_samples=100000):
+        """Строит таблицу точным движком, сохраняет ее на диск и измеряет погрешность"""
+        axis = cls.grid(points)
+        system = FuzzyEfficiencySystem(engine=engine)
+        shape = (points,) * len(INPUT_NAMES)
+        table = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+
+        # Заполняем по срезам первой оси, чтобы не держать всю сетку в памяти
+        rest = np.array(list(product(axis, repeat=len(INPUT_NAMES) - 1)))
+        for i, value in enumerate(axis):
+            values = np.column_stack([np.full(len(rest), value), rest])
+            table[i] = system.evaluate_batch(values).reshape(shape[1:])
+        table.flush()
+
+        lut = cls(table)
+        lut.measure_error(system, error_samples)
+        lut._save_meta(path, engine)
+        return lut
+
+    @classmethod
+    def load(cls, path):
+        """Открывает сохраненную таблицу через memory-map"""
+        table = np.load(path, mmap_mode='r')
+        meta = {}
+        if os.path.exists(cls._meta_path(path)):
+            with open(cls._meta_path(path)) as f:
+                meta = json.load(f)
+        return cls(table, meta.get('max_error'), meta.get('mean_error'))
+
+    @staticmethod
+    def _meta_path(path):
+        return os.path.splitext(path)[0] + '.json'
+
+    def _save_meta(self, path, engine):
+        with open(self._meta_path(path), 'w') as f:
+            json.dump({
+                'points': self.points,
+                'engine': engine,
+                'max_error': self.max_error,
+                'mean_error': self.mean_error,
+            }, f, indent=2)
+
+    def measure_error(self, system=None, n_samples=100000, seed=0):
+        """Максимальная и средняя погрешность таблицы относительно точного движка"""
+        system = system or FuzzyEfficiencySystem(engine='analytic')
+        rng = np.random.default_rng(seed)
+        values = np.vstack([
+            rng.uniform(UNIVERSE[0], UNIVERSE[-1], size=(n_samples, len(INPUT_NAMES))),
+            rng.integers(UNIVERSE[0], UNIVERSE[-1] + 1, size=(n_samples, len(INPUT_NAMES))),
+        ])
+        error = np.abs(self.evaluate_batch(values) - system.evaluate_batch(values))
+        error = error[~np.isnan(error)]
+        self.max_error = float(error.max(initial=0.0))
+        self.mean_error = float(error.mean()) if len(error) else 0.0
+        return self.max_error
+
+    def evaluate_batch(self, values):
+        """Полилинейная интерполяция по таблице для массива N x 6.
+
+        Узлы, где эффективность не определена (NaN), исключаются из интерполяции
+        с перенормировкой весов; NaN возвращается, только если все узлы с
+        ненулевым весом не определены.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) > BATCH_CHUNK_SIZE:
+            return np.concatenate([self.evaluate_batch(values[start:start + BATCH_CHUNK_SIZE])
+                                   for start in range(0, len(values), BATCH_CHUNK_SIZE)])
+        scale = (self.points - 1) / (UNIVERSE[-1] - UNIVERSE[0])
+        position = (np.clip(values, UNIVERSE[0], UNIVERSE[-1]) - UNIVERSE[0]) * scale
+        lower = np.minimum(position.astype(np.int64), self.points - 2)
+        frac = position - lower
+        # Значения всех 64 соседних узлов одним чтением: (N, 2, 2, 2, 2, 2, 2)
+        base = lower @ self._strides
+        cells = np.asarray(self._flat[base[:, None] + self._corner_offsets], dtype=np.float64)
+        known = ~np.isnan(cells)
+        total = np.where(known, cells, 0.0).reshape((len(values),) + (2,) * len(INPUT_NAMES))
+        weight_sum = known.astype(np.float64).reshape(total.shape)
+
+        # Сворачиваем оси по очереди: v = v0 * (1 - t) + v1 * t
+        for i in range(len(INPUT_NAMES)):
+            t = frac[:, i].reshape((-1,) + (1,) * (len(INPUT_NAMES) - 1 - i))
+            total = total[:, 0] * (1.0 - t) + total[:, 1] * t
+            weight_sum = weight_sum[:, 0] * (1.0 - t) + weight_sum[:, 1] * t
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(weight_sum > 1e-12, total / weight_sum, np.nan)
@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+
+from logic.fuzzy_logic import FuzzyEfficiencySystem, INPUT_NAMES, UNIVERSE
+
+# Ограничения по умолчанию: вход -> (наименьшее, наибольшее) относительное изменение
+DEFAULT_CONSTRAINTS = {
+    'costs': (-0.2, 0.2),
+    'investments': (-0.2, 0.2),
+}
+
+# Число кандидатов на строку в одном шаге поиска и число шагов уточнения.
+# Сетка 9 x 9 для двух входов по умолчанию дает тот же прирост, что и в 25 раз
+# большая: точность добирается шагами уточнения. Крупная сетка (candidates=2048)
+# нужна только для мелких локальных максимумов и задается явно
+OPTIMIZER_CANDIDATES = 81
+OPTIMIZER_ROUNDS = 4
+
+# Наибольшее число оцениваемых строк (строки x кандидаты) в одном вызове evaluate_batch
+OPTIMIZER_BATCH_ROWS = 1 << 20
+
+# Формулировки изменений: вход -> (при увеличении, при уменьшении)
+INPUT_ACTIONS = {
+    'profit': ("увеличить прибыль", "снизить прибыль"),
+    'costs': ("увеличить затраты", "сократить затраты"),
+    'investments': ("увеличить инвестиции", "сократить инвестиции"),
+    'market_share': ("увеличить долю рынка", "уменьшить долю рынка"),
+    'economic_stability': ("повысить экономическую стабильность", "снизить экономическую стабильность"),
+    'tax_rate': ("повысить налоговую ставку", "снизить налоговую ставку"),
+}
+
+
+class WhatIfOptimizer:
+    """Поиск изменения входов с наибольшим приростом эффективности.
+
+    Менять можно только входы из constraints, каждый в пределах своего
+    относительного изменения (-0.2 - на 20% меньше текущего значения);
+    значения обрезаются до универсума 0-100. Поиск идет по сетке: на первом
+    шаге сетка покрывает всю допустимую область, на следующих сужается вокруг
+    лучшего кандидата. На каждом шаге кандидаты всех строк оцениваются одним
+    пакетом evaluate_batch. Из кандидатов с одинаковой эффективностью
+    выбирается наименьшее изменение, поэтому без выигрыша входы не меняются.
+    """
+
+    def __init__(self, system=None, engine='skfuzzy', constraints=None, candidates=OPTIMIZER_CANDIDATES,
+                 rounds=OPTIMIZER_ROUNDS):
+        self.system = system if system is not None else FuzzyEfficiencySystem(engine=engine)
+        self.constraints = dict(DEFAULT_CONSTRAINTS if constraints is None else constraints)
+        unknown = set(self.constraints) - set(INPUT_NAMES)
+        if unknown:
+            raise ValueError(f"Неизвестные входы: {', '.join(sorted(unknown))}")
+        if not self.constraints:
+            raise ValueError("Нужно разрешить изменение хотя бы одного входа")
+        self.columns = [name for name in INPUT_NAMES if name in self.constraints]
+        bounds = np.array([self.constraints[name] for name in self.columns], dtype=np.float64)
+        if (bounds[:, 0] > bounds[:, 1]).any():
+            raise ValueError("Нижняя граница изменения больше верхней")
+        self.low, self.high = bounds[:, 0], bounds[:, 1]
+        # Точек сетки на ось: candidates^(1/d), но не меньше трех (центр и края)
+        self.points = max(3, int(candidates ** (1 / len(self.columns)) + 1e-9))
+        self.rounds = rounds
+        axis = np.linspace(-1.0, 1.0, self.points)
+        self.grid = np.stack(np.meshgrid(*[axis] * len(self.columns), indexing='ij'), axis=-1)
+        self.grid = self.grid.reshape(-1, len(self.columns))
+
+    def optimize(self, inputs):
+        """Лучшее изменение для одной компании (словарь входов, как у evaluate).
+
+        Возвращает словарь: inputs (новые значения всех входов), changes
+        {вход: относительное изменение} для изменяемых входов, baseline,
+        efficiency и gain (прирост эффективности).
+        """
+        row = self.optimize_batch(pd.DataFrame([{name: float(inputs[name]) for name in INPUT_NAMES}])).iloc[0]
+        new_inputs = {name: float(inputs[name]) for name in INPUT_NAMES}
+        new_inputs.update({name: float(row[f'{name}_new']) for name in self.columns})
+        return {
+            'inputs': new_inputs,
+            'changes': {name: float(row[f'{name}_change']) for name in self.columns},
+            'baseline': float(row['baseline']),
+            'efficiency': float(row['efficiency']),
+            'gain': float(row['gain']),
+        }
+
+    def optimize_batch(self, data):
+        """Лучшие изменения для всех строк DataFrame со столбцами входов.
+
+        Возвращает DataFrame с тем же индексом: <вход>_new и <вход>_change
+        (относительное изменение) для изменяемых входов, baseline (текущая
+        эффективность), efficiency (после изменения) и gain. Если в строке
+        не сработало ни одно правило ни для одного кандидата, результат NaN.
+        """
+        values = data[list(INPUT_NAMES)].to_numpy(dtype=np.float64)
+        base = values[:, [INPUT_NAMES.index(name) for name in self.columns]]
+        # Строки обрабатываются порциями, чтобы пакет оценки не разрастался
+        step = max(1, OPTIMIZER_BATCH_ROWS // (len(self.grid) + 2))
+        parts = [self._search(values[start:start + step], base[start:start + step])
+                 for start in range(0, len(values), step)]
+        parts = parts or [(np.empty((0, len(self.columns))), np.empty(0), np.empty(0))]
+        changes, baseline, efficiency = (np.concatenate(part) for part in zip(*parts))
+
+        new_values = self._apply(base, changes)
+        result = {}
+        for i, name in enumerate(self.columns):
+            result[f'{name}_new'] = new_values[:, i]
+            result[f'{name}_change'] = changes[:, i]
+        result['baseline'] = baseline
+        result['efficiency'] = efficiency
+        result['gain'] = efficiency - baseline
+        return pd.DataFrame(result, index=data.index)
+
+    def _search(self, values, base):
+        """Поиск по сетке для порции строк; возвращает изменения, текущую и лучшую эффективность"""
+        rows, dims = base.shape
+        center = np.broadcast_to((self.low + self.high) / 2, (rows, dims))
+        half = np.broadcast_to((self.high - self.low) / 2, (rows, dims))
+        best = np.zeros((rows, dims))
+        baseline = best_score = None
+        for _ in range(self.rounds):
+            # Первые два кандидата - без изменений и лучший найденный
+            candidates = np.concatenate([
+                np.zeros((rows, 1, dims)),
+                best[:, None, :],
+                np.clip(center[:, None, :] + half[:, None, :] * self.grid, self.low, self.high),
+            ], axis=1)
+            scores = self._evaluate(values, base, candidates)
+            if baseline is None:
+                baseline = scores[:, 0]
+            index = self._choose(candidates, scores)
+            best = candidates[np.arange(rows), index]
+            best_score = scores[np.arange(rows), index]
+            center = best
+            half = half * min(0.5, 2 / (self.points - 1))
+        return best, baseline, best_score
+
+    def _evaluate(self, values, base, candidates):
+        rows, count, dims = candidates.shape
+        batch = np.repeat(values[:, None, :], count, axis=1)
+        batch[:, :, [INPUT_NAMES.index(name) for name in self.columns]] = self._apply(base[:, None, :], candidates)
+        return self.system.evaluate_batch(batch.reshape(-1, len(INPUT_NAMES))).reshape(rows, count)
+
+    @staticmethod
+    def _apply(base, changes):
+        return np.clip(base * (1 + changes), UNIVERSE[0], UNIVERSE[-1])
+
+    @staticmethod
+    def _choose(candidates, scores):
+        """Индекс лучшего кандидата строки; при равенстве - с наименьшим изменением"""
+        filled = np.where(np.isnan(scores), -np.inf, scores)
+        top = filled >= filled.max(axis=1, keepdims=True) - 1e-9
+        size = np.where(top, np.abs(candidates).sum(axis=2), np.inf)
+        return size.argmin(axis=1)
+
+    @staticmethod
+    def describe(result, min_gain=0.5):
+        """Текстовые рекомендации по результату optimize (или строке optimize_batch)"""
+        if hasattr(result, 'index') and 'gain' in result.index:
+            changes = {key[:-len('_change')]: result[key] for key in result.index if key.endswith('_change')}
+            gain = result['gain']
+        else:
+            changes, gain = result['changes'], result['gain']
+        if np.isnan(gain) or gain < min_gain:
+            return ["Допустимые изменения не повышают эффективность"]
+        actions = [f"{INPUT_ACTIONS[name][change < 0]} на {abs(change):.0%}"
+                   for name, change in changes.items() if abs(change) >= 0.005]
+        text = ', '.join(actions)
+        return [f"{text[:1].upper()}{text[1:]} → +{gain:.1f} к эффективности"]
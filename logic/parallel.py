@@ -0,0 +1,124 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from logic.fuzzy_logic import FuzzyEfficiencySystem, INPUT_NAMES
+
+# Размер блока строк, отправляемого одному процессу
+DEFAULT_CHUNK_SIZE = 100000
+
+# Система оценки процесса-исполнителя, создается один раз в _init_worker
+_worker_system = None
+
+
+def _init_worker(engine, lookup_path=None):
+    global _worker_system
+    _worker_system = None if engine is None else FuzzyEfficiencySystem(engine=engine, lookup_path=lookup_path)
+
+
+def worker_system():
+    """Система оценки текущего процесса-исполнителя (None, если engine не задан)"""
+    return _worker_system
+
+
+def _score_chunk(values):
+    return _worker_system.evaluate_batch(values)
+
+
+def _executor(workers, engine, lookup_path):
+    return ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(engine, lookup_path),
+    )
+
+
+def ordered_map(task, args, workers=None, engine='skfuzzy', lookup_path=None):
+    """Выдает task(*item) для каждого кортежа из списка args в исходном порядке.
+
+    При workers == 1 или одной задаче все выполняется в текущем процессе,
+    иначе - пулом из workers процессов (по умолчанию все ядра). Задача
+    получает систему оценки процесса через worker_system(), поэтому task
+    должна быть функцией уровня модуля. В обработке одновременно не больше
+    двух задач на процесс, поэтому память ограничена размером задачи, а не
+    всего набора. Генератор можно не дочитывать: незапущенные задачи
+    отменяются.
+    """
+    if workers == 1 or len(args) <= 1:
+        _init_worker(engine, lookup_path)
+        for item in args:
+            yield task(*item)
+        return
+
+    workers = workers or os.cpu_count()
+    executor = _executor(workers, engine, lookup_path)
+    try:
+        pending = deque()
+        for item in args:
+            pending.append(executor.submit(task, *item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def score_parallel(data, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, engine='skfuzzy', lookup_path=None):
+    """Оценивает эффективность на пуле процессов.
+
+    data - DataFrame, массив N x 6 или путь к CSV. Строки делятся на блоки по
+    chunk_size, блоки оцениваются параллельно, результат собирается в исходном
+    порядке: для DataFrame - столбец 'efficiency' с тем же индексом, для CSV -
+    столбец с RangeIndex, для массива - массив.
+    """
+    if isinstance(data, (str, os.PathLike)):
+        return pd.concat(
+            [chunk['efficiency'] for chunk in score_csv_chunks(data, workers, chunk_size, engine, lookup_path)],
+            ignore_index=True,
+        )
+
+    if hasattr(data, 'columns'):
+        values = data[list(INPUT_NAMES)].to_numpy(dtype=np.float64)
+    else:
+        values = np.asarray(data, dtype=np.float64)
+
+    chunks = [values[start:start + chunk_size] for start in range(0, len(values), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        _init_worker(engine, lookup_path)
+        scored = [_score_chunk(chunk) for chunk in chunks]
+    else:
+        with _executor(workers, engine, lookup_path) as executor:
+            scored = list(executor.map(_score_chunk, chunks))
+    result = np.concatenate(scored) if scored else np.empty(0)
+
+    if hasattr(data, 'columns'):
+        return pd.Series(result, index=data.index, name='efficiency')
+    return result
+
+
+def score_csv_chunks(filename, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, engine='skfuzzy', lookup_path=None):
+    """Читает CSV блоками и по порядку выдает их со столбцом 'efficiency'.
+
+    В обработке одновременно не больше двух блоков на процесс, поэтому память
+    ограничена размером блока, а не файла.
+    """
+    workers = workers or os.cpu_count()
+    with _executor(workers, engine, lookup_path) as executor:
+        pending = deque()
+        for chunk in pd.read_csv(filename, chunksize=chunk_size):
+            values = chunk[list(INPUT_NAMES)].to_numpy(dtype=np.float64)
+            pending.append((chunk, executor.submit(_score_chunk, values)))
+            if len(pending) >= 2 * workers:
+                yield _assemble(*pending.popleft())
+        while pending:
+            yield _assemble(*pending.popleft())
+
+
+def _assemble(chunk, future):
+    chunk = chunk.copy()
+    chunk['efficiency'] = future.result()
+    return chunk
@@ -0,0 +1,62 @@
+import numpy as np
+
+from logic.cache import EvaluationCache
+from logic.fuzzy_logic import FuzzyEfficiencySystem, INPUT_NAMES, UNIVERSE
+
+# Число точек сетки по каждой оси (101 x 101 - шаг 1 на универсуме 0-100)
+SURFACE_RESOLUTION = 101
+
+# Сколько поверхностей хранить в кэше
+SURFACE_CACHE_SIZE = 64
+
+
+class SensitivityAnalyzer:
+    """Поверхность эффективности по сетке двух входов при фиксированных остальных.
+
+    Вся сетка оценивается одним вызовом evaluate_batch. Поверхности хранятся
+    в LRU-кэше по ключу (пара входов, значения остальных четырех), причем пара
+    приводится к порядку INPUT_NAMES: поверхность для осей (y, x) - это
+    транспонированная поверхность (x, y), и повторный выбор тех же осей при
+    тех же значениях полей не требует пересчета.
+    """
+
+    def __init__(self, system=None, engine='skfuzzy', resolution=SURFACE_RESOLUTION, cache_size=SURFACE_CACHE_SIZE):
+        self.system = system if system is not None else FuzzyEfficiencySystem(engine=engine)
+        self.axis = np.linspace(UNIVERSE[0], UNIVERSE[-1], resolution)
+        self.cache = EvaluationCache(cache_size)
+
+    def surface(self, x, y, inputs):
+        """Эффективность на сетке: массив len(axis) x len(axis), строки - значения y, столбцы - x.
+
+        inputs - словарь входов (как у evaluate); значения x и y из него не
+        используются. Точки, где не сработало ни одно правило, - NaN.
+        Возвращаемый массив только для чтения, он общий с кэшем.
+        """
+        if x not in INPUT_NAMES or y not in INPUT_NAMES:
+            raise ValueError(f"Оси должны быть входами: {', '.join(INPUT_NAMES)}")
+        if x == y:
+            raise ValueError("Для поверхности нужны два разных входа")
+        first, second = sorted((x, y), key=INPUT_NAMES.index)
+        fixed = tuple(float(inputs[name]) for name in INPUT_NAMES if name not in (first, second))
+        key = (first, second, fixed)
+        values = self.cache.get(key)
+        if values is None:
+            values = self._evaluate(first, second, inputs)
+            self.cache.put(key, values)
+        # В кэше строки поверхности - значения second, столбцы - first
+        return values if x == first else values.T
+
+    def _evaluate(self, first, second, inputs):
+        grid_first, grid_second = np.meshgrid(self.axis, self.axis)
+        rows = np.empty((grid_first.size, len(INPUT_NAMES)))
+        for i, name in enumerate(INPUT_NAMES):
+            rows[:, i] = float(inputs[name])
+        rows[:, INPUT_NAMES.index(first)] = grid_first.ravel()
+        rows[:, INPUT_NAMES.index(second)] = grid_second.ravel()
+        values = self.system.evaluate_batch(rows).reshape(grid_first.shape)
+        values.flags.writeable = False
+        return values
+
+    def cache_stats(self):
+        """Счетчики кэша поверхностей (hits, misses, evictions, size)"""
+        return self.cache.stats()
@@ -0,0 +1,138 @@
+from collections import deque
+
+import numpy as np
+
+from logic.fuzzy_logic import INPUT_NAMES, UNIVERSE
+from logic.parallel import ordered_map, worker_system
+
+# Разброс входов по умолчанию вокруг текущих значений компании:
+#   ('normal', sigma)              - нормальный шум
+#   ('uniform', low, high)         - равномерный сдвиг из [low, high]
+#   ('shock', probability, delta)  - с вероятностью probability значение сдвигается на delta
+#   ('fixed',)                     - значение не меняется
+# Налоговый шок повторяет повышение ставки на 6-7 месяц в genCSV.py (2 месяца из 12, +30)
+DEFAULT_DISTRIBUTIONS = {
+    'profit': ('normal', 5.0),
+    'costs': ('normal', 5.0),
+    'investments': ('normal', 5.0),
+    'market_share': ('normal', 5.0),
+    'economic_stability': ('normal', 5.0),
+    'tax_rate': ('shock', 2 / 12, 30.0),
+}
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# Число выборок в одном пакете оценки
+SIMULATION_BATCH_SIZE = 50000
+
+
+def sample_inputs(rng, inputs, distributions, size):
+    """Выборка size строк входов (массив size x 6) вокруг значений inputs.
+
+    Входы без распределения остаются неизменными; результат обрезается до
+    границ универсума 0-100.
+    """
+    samples = np.empty((size, len(INPUT_NAMES)))
+    for i, name in enumerate(INPUT_NAMES):
+        base = float(inputs[name])
+        spec = distributions.get(name, ('fixed',))
+        kind = spec[0]
+        if kind == 'fixed':
+            samples[:, i] = base
+        elif kind == 'normal':
+            samples[:, i] = rng.normal(base, spec[1], size)
+        elif kind == 'uniform':
+            samples[:, i] = base + rng.uniform(spec[1], spec[2], size)
+        elif kind == 'shock':
+            samples[:, i] = base + np.where(rng.random(size) < spec[1], spec[2], 0.0)
+        else:
+            raise ValueError(f"Неизвестное распределение {kind} для {name}")
+    return np.clip(samples, UNIVERSE[0], UNIVERSE[-1])
+
+
+class MonteCarloSimulator:
+    """Оценка риска: распределение эффективности при случайном разбросе входов.
+
+    Выборки оцениваются пакетами по batch_size через evaluate_batch. У пакета
+    свой поток случайных чисел (SeedSequence(seed) с ключом номера пакета),
+    поэтому результат при одном seed не зависит от числа процессов. После
+    каждого пакета квантили пересчитываются; если за последние два пакета ни
+    один не сдвинулся больше чем на tolerance, расчет останавливается досрочно.
+    """
+
+    def __init__(self, distributions=None, engine='skfuzzy', lookup_path=None, batch_size=SIMULATION_BATCH_SIZE,
+                 seed=None):
+        self.distributions = dict(DEFAULT_DISTRIBUTIONS if distributions is None else distributions)
+        self.engine = engine
+        self.lookup_path = lookup_path
+        self.batch_size = batch_size
+        self.seed = np.random.SeedSequence(seed).entropy
+
+    def run(self, inputs, n_samples=500000, threshold=30.0, quantiles=DEFAULT_QUANTILES, tolerance=0.05,
+            min_samples=100000, workers=1, progress=None):
+        """Моделирует эффективность для входов inputs (словарь, как у evaluate).
+
+        n_samples - наибольшее число выборок; tolerance - допустимый сдвиг
+        квантилей (в пунктах эффективности) для досрочной остановки, не раньше
+        min_samples выборок (None - без остановки). progress(samples_done)
+        вызывается после каждого пакета. Возвращает словарь: samples, mean,
+        std, quantiles {q: значение}, prob_below (доля выборок с
+        эффективностью ниже threshold) и ее стандартная ошибка prob_below_se,
+        failed (выборки, где не сработало ни одно правило), converged.
+        """
+        n_batches = -(-n_samples // self.batch_size)
+        scores, history = [], deque(maxlen=3)
+        converged = False
+        done = 0
+        for batch in self._batches(inputs, n_batches, n_samples, workers):
+            scores.append(batch)
+            done += len(batch)
+            current = self._quantiles(scores, quantiles)
+            history.append(current)
+            if progress is not None:
+                progress(done)
+            if tolerance is not None and done >= min_samples and len(history) == history.maxlen:
+                shift = np.nanmax(np.abs(np.array(history) - current))
+                if shift <= tolerance:
+                    converged = True
+                    break
+        return self._summary(np.concatenate(scores), threshold, quantiles, converged)
+
+    def _batches(self, inputs, n_batches, n_samples, workers):
+        """Оценки пакетов по порядку; при workers != 1 - пулом процессов (см. ordered_map)"""
+        inputs = {name: float(inputs[name]) for name in INPUT_NAMES}
+        sizes = [min(self.batch_size, n_samples - index * self.batch_size) for index in range(n_batches)]
+        args = [(inputs, self.distributions, self.seed, index, size) for index, size in enumerate(sizes)]
+        return ordered_map(_simulate_batch, args, workers, self.engine, self.lookup_path)
+
+    @staticmethod
+    def _quantiles(scores, quantiles):
+        values = np.concatenate(scores)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return np.full(len(quantiles), np.nan)
+        return np.quantile(values, quantiles)
+
+    @staticmethod
+    def _summary(scores, threshold, quantiles, converged):
+        failed = np.isnan(scores)
+        values = scores[~failed]
+        n = len(values)
+        prob = float(np.mean(values < threshold)) if n else float('nan')
+        levels = np.quantile(values, quantiles).tolist() if n else [float('nan')] * len(quantiles)
+        return {
+            'samples': len(scores),
+            'failed': int(failed.sum()),
+            'mean': float(values.mean()) if n else float('nan'),
+            'std': float(values.std(ddof=1)) if n > 1 else float('nan'),
+            'quantiles': dict(zip(quantiles, levels)),
+            'threshold': threshold,
+            'prob_below': prob,
+            'prob_below_se': float(np.sqrt(prob * (1 - prob) / n)) if n else float('nan'),
+            'converged': converged,
+        }
+
+
+def _simulate_batch(inputs, distributions, seed, index, size):
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(index,)))
+    return worker_system().evaluate_batch(sample_inputs(rng, inputs, distributions, size))
@@ -1,11 +1,18 @@
+import os
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import pandas as pd
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from data.database import DatabaseManager
-from logic.fuzzy_logic import FuzzyEfficiencySystem
-from logic.analysis import DataAnalyzer, TrendAnalyzer, RecommendationEngine
+
+from presentation.worker import BackgroundWorker, JobCancelled
+
+# Хранилище результатов: файл SQLite или каталог столбцового хранилища
+RESULTS_STORE = os.environ.get('EFFICIENCY_RESULTS_STORE', 'efficiency.db')
+
+# Сколько строк сохранять в базу за один вызов save_results (между вызовами - прогресс и отмена)
+SAVE_BATCH_ROWS = 50000
+
+# pandas, matplotlib и skfuzzy загружаются после показа окна (см. _preload),
+# поэтому модуль импортирует только tkinter
 
 
 class EfficiencyApp:
@@ -14,15 +21,79 @@ class EfficiencyApp:
         self.root.title("Анализ эффективности предприятия")
         self.root.geometry("1000x800")
 
-        # Инициализация компонентов системы
-        self.db_manager = DatabaseManager()
-        self.fuzzy_system = FuzzyEfficiencySystem()
-        self.data = pd.DataFrame()
+        # Компоненты системы создаются при первом обращении
+        self._components_lock = threading.Lock()
+        self._db_manager = None
+        self._fuzzy_system = None
+        self._sensitivity = None
+        self.data = None
+        self.figure = None
+        self.plot_canvas = None
+
+        # Операции с БД выполняются в фоновом потоке, окно не блокируется
+        self.worker = BackgroundWorker(self.root)
 
         # Настройка интерфейса
         self._setup_ui()
         self._create_menu()
 
+        # Тяжелые модули и нечеткая система готовятся в фоне, окно уже на экране
+        self.status_var.set("Загрузка...")
+        self._loader = threading.Thread(target=self._preload, daemon=True)
+        self.root.after_idle(self._loader.start)
+        self.root.after(100, self._finish_startup)
+
+    @property
+    def db_manager(self):
+        with self._components_lock:
+            if self._db_manager is None:
+                from data.database import open_results_store
+                self._db_manager = open_results_store(RESULTS_STORE)
+            return self._db_manager
+
+    @property
+    def fuzzy_system(self):
+        with self._components_lock:
+            if self._fuzzy_system is None:
+                from logic.fuzzy_logic import FuzzyEfficiencySystem
+                self._fuzzy_system = FuzzyEfficiencySystem(cache_size=4096)
+            return self._fuzzy_system
+
+    @property
+    def sensitivity(self):
+        # Своя система без кэша строк: сетка поверхности кэшируется целиком
+        if self._sensitivity is None:
+            from logic.sensitivity import SensitivityAnalyzer
+            self._sensitivity = SensitivityAnalyzer(engine=self.fuzzy_system.engine)
+        return self._sensitivity
+
+    def _preload(self):
+        """Фоновая загрузка модулей и построение нечеткой системы"""
+        import pandas  # noqa: F401
+        import matplotlib.figure  # noqa: F401
+        import matplotlib.backends.backend_tkagg  # noqa: F401
+        import logic.analysis  # noqa: F401
+        self.fuzzy_system.warm_up()
+
+    def _finish_startup(self):
+        if self._loader.is_alive() or not self._loader.ident:
+            self.root.after(100, self._finish_startup)
+            return
+        self._ensure_plot_canvas()
+        self.status_var.set("Готово")
+
+    def _ensure_plot_canvas(self):
+        """Создает область графиков matplotlib при первой необходимости"""
+        if self.plot_canvas is None:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            self.figure = Figure(figsize=(10, 6), dpi=100)
+            self.plot_canvas = FigureCanvasTkAgg(self.figure, master=self.plot_frame)
+            self.plot_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+    def _has_data(self):
+        return self.data is not None and not self.data.empty
+
     def _setup_ui(self):
         # Основной контейнер
         main_frame = ttk.Frame(self.root)
@@ -40,6 +111,7 @@ class EfficiencyApp:
         ]
 
         self.entries = {}
+        self.param_labels = {param: label.rstrip(':') for param, label in params}
         for i, (param, label) in enumerate(params):
             ttk.Label(input_frame, text=label).grid(row=i, column=0, padx=5, pady=2, sticky=tk.E)
             entry = ttk.Entry(input_frame)
@@ -51,12 +123,33 @@ class EfficiencyApp:
             input_frame,
             text="Рассчитать эффективность",
             command=self._calculate_efficiency
-        ).grid(row=len(params), columnspan=2, pady=10)
+        ).grid(row=len(params), columnspan=2, pady=(10, 2))
+        ttk.Button(
+            input_frame,
+            text="Оценить риск (Монте-Карло)",
+            command=self._simulate_risk
+        ).grid(row=len(params) + 1, columnspan=2, pady=2)
 
-        # Графики
-        self.figure = Figure(figsize=(10, 6), dpi=100)
-        self.plot_canvas = FigureCanvasTkAgg(self.figure, master=main_frame)
-        self.plot_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # Карта чувствительности: эффективность по двум выбранным входам
+        axes_frame = ttk.Frame(input_frame)
+        axes_frame.grid(row=len(params) + 2, columnspan=2, pady=(2, 10))
+        names = list(self.param_labels.values())
+        self.surface_axes = []
+        for column, default in enumerate((1, 2)):
+            combo = ttk.Combobox(axes_frame, values=names, state='readonly', width=18)
+            combo.current(default)
+            combo.grid(row=0, column=column, padx=2)
+            combo.bind('<<ComboboxSelected>>', lambda event: self._show_sensitivity())
+            self.surface_axes.append(combo)
+        ttk.Button(
+            axes_frame,
+            text="Карта чувствительности",
+            command=self._show_sensitivity
+        ).grid(row=0, column=2, padx=2)
+
+        # Графики (холст matplotlib создается в _ensure_plot_canvas)
+        self.plot_frame = ttk.Frame(main_frame)
+        self.plot_frame.pack(fill=tk.BOTH, expand=True)
 
         # Статус бар
         self.status_var = tk.StringVar()
@@ -73,6 +166,7 @@ class EfficiencyApp:
         # Меню файла
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Загрузить данные", command=self._load_data)
+        file_menu.add_command(label="Импорт CSV в БД", command=self._ingest_csv)
         file_menu.add_command(label="Сохранить отчет", command=self._export_report)
         file_menu.add_separator()
         file_menu.add_command(label="Выход", command=self.root.quit)
@@ -89,75 +183,271 @@ class EfficiencyApp:
         db_menu = tk.Menu(menubar, tearoff=0)
         db_menu.add_command(label="Сохранить в БД", command=self._save_to_db)
         db_menu.add_command(label="Загрузить из БД", command=self._load_from_db)
+        db_menu.add_command(label="Экспорт БД", command=self._export_db)
+        db_menu.add_command(label="Прогноз по БД (12 мес.)", command=self._forecast_db)
+        db_menu.add_separator()
+        db_menu.add_command(label="Отменить операцию", command=self._cancel_jobs)
         menubar.add_cascade(label="База данных", menu=db_menu)
 
         self.root.config(menu=menubar)
 
     def _calculate_efficiency(self):
-        try:
-            inputs = {
-                'profit': float(self.entries['profit'].get()),
-                'costs': float(self.entries['costs'].get()),
-                'investments': float(self.entries['investments'].get()),
-                'market_share': float(self.entries['market_share'].get()),
-                'economic_stability': float(self.entries['economic_stability'].get()),
-                'tax_rate': float(self.entries['tax_rate'].get())
-            }
+        import pandas as pd
+        from logic.analysis import RecommendationEngine
+        from logic.optimizer import WhatIfOptimizer
 
+        try:
+            inputs = self._read_inputs()
             efficiency = self.fuzzy_system.evaluate(inputs)
+            # Подбор изменений затрат и инвестиций в пределах ±20%
+            optimizer = WhatIfOptimizer(engine=self.fuzzy_system.engine)
             messagebox.showinfo(
                 "Результат",
                 f"Оценка эффективности: {efficiency:.2f}\n\n" +
-                "\n".join(RecommendationEngine.generate_recommendations(pd.DataFrame([inputs])))
+                "\n".join(RecommendationEngine.generate_recommendations(pd.DataFrame([inputs]))) +
+                "\n\n" + "\n".join(WhatIfOptimizer.describe(optimizer.optimize(inputs)))
             )
         except ValueError:
             messagebox.showerror("Ошибка", "Пожалуйста, введите корректные числовые значения")
 
+    def _read_inputs(self):
+        """Значения полей ввода (ValueError, если число введено неверно)"""
+        return {param: float(entry.get()) for param, entry in self.entries.items()}
+
+    def _simulate_risk(self):
+        try:
+            inputs = self._read_inputs()
+        except ValueError:
+            messagebox.showerror("Ошибка", "Пожалуйста, введите корректные числовые значения")
+            return
+
+        def simulate(job):
+            from logic.simulation import MonteCarloSimulator
+            simulator = MonteCarloSimulator(engine=self.fuzzy_system.engine)
+            return simulator.run(inputs, progress=job.progress)
+
+        def done(result):
+            quantiles = "\n".join(f"  {q:.0%}: {value:.2f}" for q, value in result['quantiles'].items())
+            self.status_var.set(f"Моделирование завершено: {result['samples']} выборок")
+            messagebox.showinfo(
+                "Оценка риска",
+                f"Выборок: {result['samples']}\n"
+                f"Средняя эффективность: {result['mean']:.2f} (σ = {result['std']:.2f})\n"
+                f"Квантили:\n{quantiles}\n"
+                f"Вероятность эффективности ниже {result['threshold']:.0f}: {result['prob_below']:.1%}"
+            )
+
+        self.status_var.set("Моделирование риска...")
+        self.worker.submit(
+            simulate,
+            on_progress=lambda samples: self.status_var.set(f"Моделирование риска: {samples} выборок"),
+            on_done=done,
+            on_error=self._on_job_error,
+        )
+
     def _load_data(self):
         filename = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
         if filename:
+            import pandas as pd
             self.data = pd.read_csv(filename)
+            if 'efficiency' not in self.data.columns:
+                self.data['efficiency'] = self.fuzzy_system.evaluate_batch(self.data)
             self._update_plots()
             self.status_var.set(f"Данные загружены из {filename}")
 
+    def _ingest_csv(self):
+        # Можно выбрать сразу много файлов: по файлу на компанию
+        filenames = filedialog.askopenfilenames(filetypes=[("CSV files", "*.csv")])
+        if filenames:
+            def ingest(job):
+                from logic.analysis import RECOMMENDATION_RULES
+                written = self.db_manager.ingest_csv_many(filenames, self.fuzzy_system, progress=job.progress)
+                # Столбцовое хранилище флагов не ведет
+                if hasattr(self.db_manager, 'compute_flags'):
+                    self.db_manager.compute_flags(RECOMMENDATION_RULES)
+                return written
+
+            self.status_var.set(f"Импорт файлов: {len(filenames)}...")
+            self.worker.submit(
+                ingest,
+                on_progress=lambda rows: self.status_var.set(f"Импорт: записано строк {rows}"),
+                on_done=lambda written: self.status_var.set(f"Импорт завершен, добавлено строк: {written}"),
+                on_error=self._on_job_error,
+            )
+
     def _save_to_db(self):
-        if not self.data.empty:
-            self.db_manager.save_results(self.data)
-            self.status_var.set("Данные сохранены в базу данных")
+        if self._has_data():
+            from logic.analysis import RecommendationEngine
+            data = self.data.copy()
+            data['flags'] = RecommendationEngine.evaluate_flags(data)
+
+            def save(job):
+                inserted = skipped = 0
+                for start in range(0, len(data), SAVE_BATCH_ROWS):
+                    added, repeated = self.db_manager.save_results(data.iloc[start:start + SAVE_BATCH_ROWS])
+                    inserted += added
+                    skipped += repeated
+                    job.progress(inserted + skipped, len(data))
+                return inserted, skipped
+
+            self.status_var.set("Сохранение в базу данных...")
+            self.worker.submit(
+                save,
+                on_progress=lambda done, total: self.status_var.set(
+                    f"Сохранение в базу данных: {done} из {total} строк"
+                ),
+                on_done=lambda counts: self.status_var.set(
+                    "Данные сохранены в базу данных: добавлено {}, пропущено повторов {}".format(*counts)
+                ),
+                on_error=self._on_job_error,
+            )
         else:
             messagebox.showwarning("Предупреждение", "Нет данных для сохранения")
 
     def _load_from_db(self):
-        self.data = self.db_manager.load_recent_results()
-        if not self.data.empty:
+        def load(job):
+            data = self.db_manager.load_recent_results()
+            # Отмененная загрузка не заменяет текущие данные
+            job.check()
+            return data
+
+        self.status_var.set("Загрузка из базы данных...")
+        self.worker.submit(
+            load,
+            on_done=self._on_db_loaded,
+            on_error=self._on_job_error,
+        )
+
+    def _on_db_loaded(self, data):
+        self.data = data
+        if self._has_data():
             self._update_plots()
             self.status_var.set("Данные загружены из базы данных")
         else:
+            self.status_var.set("Готово")
             messagebox.showinfo("Информация", "В базе данных нет записей")
 
+    def _export_db(self):
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".parquet",
+            filetypes=[("Parquet files", "*.parquet"), ("Arrow files", "*.arrow"), ("CSV files", "*.csv")]
+        )
+        if filename:
+            def export(job):
+                if filename.lower().endswith('.csv'):
+                    return self.db_manager.export_to_csv(filename, progress=job.progress)
+                return self.db_manager.export_columnar(filename, progress=job.progress)
+
+            def failed(error):
+                # Недописанный файл после отмены или ошибки не нужен
+                if os.path.exists(filename):
+                    os.remove(filename)
+                self._on_job_error(error)
+
+            self.status_var.set(f"Экспорт в {filename}...")
+            self.worker.submit(
+                export,
+                on_progress=lambda rows: self.status_var.set(f"Экспорт в {filename}: записано строк {rows}"),
+                on_done=lambda rows: self.status_var.set(f"База данных экспортирована в {filename} ({rows} строк)"),
+                on_error=failed,
+            )
+
+    def _forecast_db(self):
+        def forecast(job):
+            from logic.forecast import EfficiencyForecaster
+            return EfficiencyForecaster().forecast_store(self.db_manager, horizon=12)
+
+        def done(result):
+            if result.empty:
+                self.status_var.set("Прогноз: в базе нет данных")
+                return
+            outlook = result.groupby('company_id').last().sort_values('efficiency')
+            lines = [f"{company or '(без компании)'}: {row.efficiency:.2f} "
+                     f"[{row.efficiency_lower:.2f}; {row.efficiency_upper:.2f}]"
+                     for company, row in outlook.head(10).iterrows()]
+            self.status_var.set(f"Прогноз построен для {len(outlook)} компаний")
+            messagebox.showinfo(
+                "Прогноз эффективности",
+                f"Эффективность через 12 месяцев, компаний: {len(outlook)}\n"
+                f"Средняя: {outlook['efficiency'].mean():.2f}\n\n"
+                "Наименьшая прогнозная эффективность (95% интервал):\n" + "\n".join(lines)
+            )
+
+        self.status_var.set("Построение прогноза...")
+        self.worker.submit(forecast, on_done=done, on_error=self._on_job_error)
+
+    def _cancel_jobs(self):
+        if self.worker.busy():
+            self.worker.cancel_all()
+            self.status_var.set("Отмена операции...")
+
+    def _on_job_error(self, error):
+        if isinstance(error, JobCancelled):
+            self.status_var.set("Операция отменена")
+        else:
+            self.status_var.set("Ошибка")
+            messagebox.showerror("Ошибка", str(error))
+
     def _export_report(self):
+        if not self._has_data():
+            messagebox.showwarning("Предупреждение", "Нет данных для отчета")
+            return
+
         filename = filedialog.asksaveasfilename(
             defaultextension=".txt",
             filetypes=[("Text files", "*.txt"), ("PDF files", "*.pdf")]
         )
         if filename:
-            with open(filename, 'w') as f:
-                f.write("Отчет по эффективности предприятия\n")
-                f.write("=" * 50 + "\n\n")
-                f.write(self.data.describe().to_string())
-                f.write("\n\nРекомендации:\n")
-                f.write("\n".join(RecommendationEngine.generate_recommendations(self.data)))
+            from logic.analysis import RecommendationEngine
+
+            by = 'company_id' if 'company_id' in self.data.columns else None
+            sections = [
+                "Отчет по эффективности предприятия\n",
+                "=" * 50 + "\n\n",
+                self.data.describe().to_string(),
+                "\n\nРекомендации:\n",
+                "\n".join(RecommendationEngine.generate_recommendations(self.data)),
+                "\n\nНарушения правил по всем строкам:\n",
+                RecommendationEngine.flag_counts(self.data, by=by).to_string(),
+            ]
+
+            def database_sections(job):
+                # Сводка по всей базе берется из агрегатов, без чтения results
+                summary = self.db_manager.summary()
+                if summary.empty:
+                    return []
+                job.check()
+                result = [
+                    "\n\nСводка по базе данных:\n",
+                    summary.to_string(),
+                    "\n\nТенденции по базе данных (изменение за месяц):\n",
+                    "\n".join(f"{k}: {v:.2f}" for k, v in self.db_manager.trend_slopes().items()),
+                ]
+                job.check()
+                company_trends = self.db_manager.company_trend_slopes()
+                if len(company_trends) > 1:
+                    result.append("\n\nТенденции по компаниям (изменение за месяц):\n")
+                    result.append(company_trends.to_string(float_format=lambda v: f"{v:.2f}"))
+                return result
 
-            self.status_var.set(f"Отчет сохранен в {filename}")
+            def write(database):
+                with open(filename, 'w') as f:
+                    f.writelines(sections + database)
+                self.status_var.set(f"Отчет сохранен в {filename}")
+
+            self.status_var.set(f"Подготовка отчета {filename}...")
+            self.worker.submit(database_sections, on_done=write, on_error=self._on_job_error)
 
     def _show_analysis(self):
-        if self.data.empty:
+        if not self._has_data():
+            from logic.analysis import DataAnalyzer
             self.data = DataAnalyzer.generate_test_data()
 
         self._update_plots()
 
     def _show_trends(self):
-        if not self.data.empty:
+        if self._has_data():
+            from logic.analysis import TrendAnalyzer
             trends = TrendAnalyzer.analyze_trends(self.data)
             message = "\n".join([f"{k}: {'↑ рост' if v > 0 else '↓ снижение'} ({v:.2f})"
                                  for k, v in trends.items()])
@@ -166,20 +456,55 @@ class EfficiencyApp:
             messagebox.showwarning("Предупреждение", "Нет данных для анализа")
 
     def _show_recommendations(self):
-        if not self.data.empty:
+        if self._has_data():
+            from logic.analysis import RecommendationEngine
             recommendations = RecommendationEngine.generate_recommendations(self.data)
             messagebox.showinfo("Рекомендации", "\n".join(recommendations))
         else:
             messagebox.showwarning("Предупреждение", "Нет данных для анализа")
 
+    def _show_sensitivity(self):
+        try:
+            inputs = self._read_inputs()
+        except ValueError:
+            messagebox.showerror("Ошибка", "Пожалуйста, введите корректные числовые значения")
+            return
+        params = list(self.param_labels)
+        x, y = (params[combo.current()] for combo in self.surface_axes)
+        if x == y:
+            messagebox.showwarning("Предупреждение", "Выберите два разных параметра")
+            return
+
+        analyzer = self.sensitivity
+        surface = analyzer.surface(x, y, inputs)
+        self._ensure_plot_canvas()
+        self.figure.clear()
+        ax = self.figure.add_subplot(111)
+        axis = analyzer.axis
+        # Области, где не сработало ни одно правило (NaN), остаются серыми
+        ax.set_facecolor('lightgray')
+        image = ax.imshow(surface, origin='lower', aspect='auto', cmap='RdYlGn', vmin=0, vmax=100,
+                          extent=(axis[0], axis[-1], axis[0], axis[-1]))
+        self.figure.colorbar(image, ax=ax, label='Эффективность')
+        ax.plot(inputs[x], inputs[y], 'o', color='black')
+        ax.set_xlabel(self.param_labels[x])
+        ax.set_ylabel(self.param_labels[y])
+        ax.set_title("Эффективность при остальных параметрах из полей ввода")
+        self.plot_canvas.draw()
+
     def _update_plots(self):
+        self._ensure_plot_canvas()
         self.figure.clear()
         ax = self.figure.add_subplot(111)
 
-        if not self.data.empty:
-            for column in self.data.columns[1:]:
-                if column != 'month':
-                    ax.plot(self.data['month'], self.data[column], label=column)
+        if self._has_data():
+            from logic.analysis import TrendAnalyzer
+            data = self.data
+            if data['month'].duplicated().any():
+                # Данные нескольких компаний: среднее по месяцу
+                data = data.groupby('month', as_index=False)[TrendAnalyzer.value_columns(data)].mean()
+            for column in TrendAnalyzer.value_columns(data):
+                ax.plot(data['month'], data[column], label=column)
 
             ax.set_xlabel('Месяц')
             ax.set_ylabel('Значение')
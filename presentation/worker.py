@@ -0,0 +1,110 @@
+import queue
+import threading
+
+
+class JobCancelled(Exception):
+    """Задача остановлена по запросу пользователя"""
+
+
+class Job:
+    """Задача фонового потока: флаг отмены и передача прогресса в окно"""
+
+    def __init__(self, worker, func, args, kwargs, on_done, on_error, on_progress):
+        self._worker = worker
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        """Прерывает задачу, если ее отменили (вызывать между шагами)"""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, *args):
+        """Передает прогресс в главный поток и проверяет отмену"""
+        if self.on_progress is not None:
+            self._worker._events.put((self.on_progress, args))
+        self.check()
+
+
+class BackgroundWorker:
+    """Один фоновый поток для долгих операций (БД, импорт, экспорт) в Tk-приложении.
+
+    Задачи выполняются по очереди. Функция задачи получает объект Job первым
+    аргументом и может сообщать прогресс через job.progress(...). Колбэки
+    on_done, on_error и on_progress вызываются в главном потоке: события
+    складываются в очередь, которую опрашивает root.after. Отмененная задача
+    завершается вызовом on_error с JobCancelled.
+    """
+
+    def __init__(self, root, poll_interval=50):
+        self.root = root
+        self.poll_interval = poll_interval
+        self._jobs = queue.Queue()
+        self._events = queue.Queue()
+        self._active = []
+        self._active_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, func, *args, on_done=None, on_error=None, on_progress=None, **kwargs):
+        """Ставит func(job, *args, **kwargs) в очередь и возвращает Job"""
+        job = Job(self, func, args, kwargs, on_done, on_error, on_progress)
+        with self._active_lock:
+            self._active.append(job)
+        self._jobs.put(job)
+        return job
+
+    def busy(self):
+        """Есть ли незавершенные задачи"""
+        with self._active_lock:
+            return bool(self._active)
+
+    def cancel_all(self):
+        """Отменяет выполняемую и все ожидающие задачи"""
+        with self._active_lock:
+            for job in self._active:
+                job.cancel()
+
+    def _finish(self, job, callback, *args):
+        with self._active_lock:
+            if job in self._active:
+                self._active.remove(job)
+        if callback is not None:
+            self._events.put((callback, args))
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job.cancelled:
+                self._finish(job, job.on_error, JobCancelled())
+                continue
+            try:
+                result = job.func(job, *job.args, **job.kwargs)
+            except Exception as error:
+                self._finish(job, job.on_error, error)
+            else:
+                self._finish(job, job.on_done, result)
+
+    def _poll(self):
+        """Вызывает колбэки задач в главном потоке"""
+        try:
+            while True:
+                callback, args = self._events.get_nowait()
+                callback(*args)
+        except queue.Empty:
+            pass
+        finally:
+            self.root.after(self.poll_interval, self._poll)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from logic.analysis import TrendAnalyzer
+from logic.generator import SyntheticDataGenerator
+
+
+def _data():
+    data = SyntheticDataGenerator(companies=3, months=12, seed=1).frame()
+    data.loc[data['company_id'] == 'company_1', 'company_id'] = None
+    return data
+
+
+def test_fit_trends_groups_missing_company_as_empty():
+    data = _data()
+    trends = TrendAnalyzer.fit_trends(data, by='company_id')
+    assert list(trends.index.get_level_values(0).unique()) == ['', 'company_2', 'company_3']
+
+    alone = TrendAnalyzer.fit_trends(data[data['company_id'].isna()].drop(columns='company_id'))
+    assert np.allclose(trends.loc['']['slope'].to_numpy(), alone['slope'].to_numpy())
+    assert TrendAnalyzer.analyze_company_trends(data).shape == (3, 6)
+
+
+def test_fit_trends_empty():
+    empty = _data().iloc[:0]
+    assert TrendAnalyzer.fit_trends(empty).empty
+    assert TrendAnalyzer.fit_trends(empty, by='company_id').empty
+    assert TrendAnalyzer.analyze_trends(empty) == {}
+
+
+def test_flags_not_a_trend_column():
+    data = _data().assign(flags=5)
+    assert 'flags' not in TrendAnalyzer.value_columns(data)
+    assert 'flags' not in TrendAnalyzer.analyze_trends(data)
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+from data.columnar import ColumnarResultsStore
+from logic.generator import SyntheticDataGenerator
+
+
+def _data(companies=2, months=12):
+    return SyntheticDataGenerator(companies=companies, months=months, seed=1).frame(engine='analytic')
+
+
+def test_append_twice_and_reopen(tmp_path):
+    data = _data()
+    store = ColumnarResultsStore(str(tmp_path))
+    assert store.save_results(data.iloc[:12]) == (12, 0)
+    assert store.save_results(data.iloc[12:]) == (12, 0)
+    assert store.save_results(data) == (0, 24)
+
+    reopened = ColumnarResultsStore(str(tmp_path))
+    assert len(reopened) == 24
+    assert reopened.companies() == sorted(data['company_id'].unique())
+    recent = reopened.load_recent_results(limit=24)
+    assert np.allclose(np.sort(recent['profit'].to_numpy()), np.sort(data['profit'].to_numpy()))
+
+
+def test_months_beyond_one_byte(tmp_path):
+    data = _data(companies=1, months=300)
+    store = ColumnarResultsStore(str(tmp_path))
+    store.save_results(data)
+    assert store.column('month').max() == 300
+    assert store.load_recent_results(limit=1)['month'].iloc[0] == 300
+
+    with pytest.raises(ValueError):
+        store.save_results(data.iloc[:1].assign(month=70000))
+
+
+def test_fractional_inputs_rejected(tmp_path):
+    data = _data(companies=1, months=2)
+    store = ColumnarResultsStore(str(tmp_path))
+    with pytest.raises(ValueError):
+        store.save_results(data.iloc[:1].assign(profit=45.2))
+    assert store.save_results(data.iloc[:1].assign(profit=45.0)) == (1, 0)
+    with pytest.raises(ValueError):
+        store.save_results(data.iloc[:1].assign(profit=44.6))
+    assert len(store) == 1
+    assert store.save_results(data.iloc[:1].assign(profit=45.0)) == (0, 1)
+
+
+def test_key_index_runs(tmp_path):
+    data = _data(companies=50)
+    store = ColumnarResultsStore(str(tmp_path))
+    for start in range(0, len(data), 70):
+        store.save_results(data.iloc[start:start + 70])
+    runs = store._meta['key_runs']
+    assert runs[0][0] == 0 and runs[-1][1] == len(data)
+    assert all(previous[1] == run[0] for previous, run in zip(runs, runs[1:]))
+    assert len(runs) <= int(np.log2(len(data) / 70)) + 1
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith('.idx')) == \
+        sorted(f'row_key.{start}-{stop}.idx' for start, stop in runs)
+
+    reopened = ColumnarResultsStore(str(tmp_path))
+    assert reopened.save_results(data.iloc[::3]) == (0, len(data.iloc[::3]))
+
+
+def test_ingest_matches_database(tmp_path):
+    from data.database import DatabaseManager
+    from logic.fuzzy_logic import FuzzyEfficiencySystem
+
+    files = []
+    for number in range(3):
+        filename = str(tmp_path / f'company_{number}.csv')
+        SyntheticDataGenerator(companies=1, months=12, seed=number).frame().drop(columns='company_id').to_csv(
+            filename, index=False)
+        files.append(filename)
+    system = FuzzyEfficiencySystem(engine='analytic')
+    store = ColumnarResultsStore(str(tmp_path / 'store'))
+    manager = DatabaseManager(str(tmp_path / 'results.db'))
+
+    assert store.ingest_csv_many(files, system, chunksize=10) == 36
+    assert manager.ingest_csv_many(files, system, chunksize=10) == 36
+    assert store.ingest_csv_many(files, system, chunksize=10) == 0
+    assert store.companies() == manager.companies()
+    assert np.allclose(store.company_trend_slopes().to_numpy(), manager.company_trend_slopes().to_numpy(),
+                       atol=1e-5)
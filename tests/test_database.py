@@ -0,0 +1,62 @@
+import pytest
+
+from data.database import DatabaseManager
+from logic.fuzzy_logic import FuzzyEfficiencySystem
+from logic.generator import SyntheticDataGenerator
+
+
+def _data(companies=2, months=12):
+    return SyntheticDataGenerator(companies=companies, months=months, seed=1).frame(engine='analytic')
+
+
+def test_save_twice(tmp_path):
+    data = _data()
+    manager = DatabaseManager(str(tmp_path / 'results.db'))
+    assert manager.save_results(data) == (len(data), 0)
+    summary = manager.summary()
+    assert manager.save_results(data) == (0, len(data))
+    assert manager.summary().loc['count'].equals(summary.loc['count'])
+    assert len(manager.load_recent_results(limit=len(data))) == len(data)
+
+
+def test_ingest_and_import_twice(tmp_path):
+    pytest.importorskip('pyarrow')
+    filename = str(tmp_path / 'companies.csv')
+    _data().drop(columns='efficiency').to_csv(filename, index=False)
+    system = FuzzyEfficiencySystem(engine='analytic')
+    manager = DatabaseManager(str(tmp_path / 'results.db'))
+    assert manager.ingest_csv(filename, system, chunksize=10) == 24
+    summary = manager.summary()
+    assert manager.ingest_csv(filename, system, chunksize=10) == 0
+
+    exported = str(tmp_path / 'results.parquet')
+    assert manager.export_columnar(exported) == 24
+    assert manager.import_columnar(exported) == 0
+    assert manager.summary().loc['count'].equals(summary.loc['count'])
+
+    copy = DatabaseManager(str(tmp_path / 'copy.db'))
+    assert copy.import_columnar(exported) == 24
+    assert copy.import_columnar(exported) == 0
+    assert copy.summary().loc['count'].equals(summary.loc['count'])
+
+
+def test_resume_interrupted_ingest(tmp_path):
+    filename = str(tmp_path / 'companies.csv')
+    _data(companies=3).drop(columns='efficiency').to_csv(filename, index=False)
+    system = FuzzyEfficiencySystem(engine='analytic')
+    manager = DatabaseManager(str(tmp_path / 'results.db'))
+
+    def interrupt(rows_done):
+        if rows_done >= 10:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        manager.ingest_csv(filename, system, chunksize=10, progress=interrupt)
+    assert manager.summary().loc['count'].max() == 10
+
+    done = []
+    assert manager.ingest_csv(filename, system, chunksize=10, progress=done.append) == 26
+    # Продолжение начинается с первой незаписанной строки
+    assert done == [10, 20, 26]
+    assert manager.summary().loc['count'].max() == 36
+    assert manager.ingest_csv(filename, system, chunksize=10) == 0
@@ -0,0 +1,16 @@
+import numpy as np
+
+from logic.fuzzy_logic import ANALYTIC_TOLERANCE, FuzzyEfficiencySystem, INPUT_NAMES
+
+
+def test_analytic_matches_skfuzzy():
+    rng = np.random.default_rng(0)
+    values = np.vstack([
+        rng.uniform(0, 100, size=(2000, len(INPUT_NAMES))),
+        rng.integers(0, 101, size=(2000, len(INPUT_NAMES))),
+    ])
+    exact = FuzzyEfficiencySystem(engine='analytic').evaluate_batch(values)
+    sampled = FuzzyEfficiencySystem(engine='skfuzzy').evaluate_batch(values)
+    defined = ~np.isnan(exact)
+    assert np.array_equal(defined, ~np.isnan(sampled))
+    assert np.max(np.abs(exact[defined] - sampled[defined]), initial=0.0) <= ANALYTIC_TOLERANCE